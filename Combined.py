@@ -3,314 +3,350 @@
 Unified ETF Scraper with Final JSON Combination
 -------------------------------------------------
 A single, combined script to scrape ETF data from Vanguard, DWS, iShares, and Amundi.
-It uses Playwright to collect ETF URLs and Firecrawl to extract holdings data.
+It uses Playwright to collect ETF URLs and the Firecrawl API (called directly over aiohttp) to extract holdings data.
 
 Process:
-1. Scrapes each provider sequentially.
+1. Collects the ETF URLs of all providers concurrently and scrapes them with Firecrawl as they arrive.
 2. Saves an individual JSON file for each provider's data.
 3. Collects all results into a master dictionary.
 4. Saves one final, combined JSON file containing the data from all providers.
 
 Requirements:
-- pip install playwright firecrawl-py
+- pip install playwright aiohttp orjson
 - playwright install
 - Set the FIRECRAWL_API_KEY as an environment variable (sign up at firecrawl.dev for a key).
 
 WARNING: Do not hardcode API keys in scripts. Use environment variables for security.
 """
+import aiohttp
+import amundi_common
+import argparse
 import asyncio
-import json
+import ishares_common
 import os
+import orjson
+import sys
+import time
+import vanguard_common
 from datetime import datetime
 from playwright.async_api import async_playwright
+from scraper_common import (
+    EXCLUDED_TAGS, MISSING_ISIN_VALUES, append_record, block_heavy_resources, click_consent_buttons, load_cached_result,
+    read_stream, repair_stream, save_cached_result,
+)
 from urllib.parse import urljoin
-from firecrawl import FirecrawlApp
 
 # --- CENTRAL CONFIGURATION ---
 # Note: TOTAL_ETFS_TO_SCRAPE applies to EACH provider.
 TOTAL_ETFS_TO_SCRAPE = 2  # Set the number of ETFs to scrape per provider
-BATCH_SIZE = 2            # Number of ETFs to process before pausing
-DELAY_BETWEEN_BATCHES_SECONDS = 1 # Pause duration in seconds between batches
+MAX_CONCURRENT_SCRAPES = 5  # Number of Firecrawl workers (match your plan's concurrency limit)
+USE_CACHE = True            # Disable with the --no-cache command-line flag
+RESUME = True               # Skip ETFs finished by an interrupted run; disable with --no-resume
 
 # --- FIRECRAWL INITIALIZATION ---
 FIRECRAWL_API_KEY = "FIRECRAWL_API_KEY"
 if not FIRECRAWL_API_KEY:
     raise ValueError("FIRECRAWL_API_KEY environment variable not set. Please get a key from firecrawl.dev.")
 
-app = FirecrawlApp(api_key=FIRECRAWL_API_KEY)
+FIRECRAWL_SCRAPE_URL = "https://api.firecrawl.dev/v1/scrape"
+FIRECRAWL_MAX_ATTEMPTS = 3  # The first attempt plus retries with a wait action and exponential backoff
+FIRECRAWL_MAX_RATE_LIMIT_RETRIES = 5  # How often a single request may be re-sent after HTTP 429
+FIRECRAWL_DEFAULT_RETRY_AFTER_SECONDS = 10  # Used when a 429 response carries no usable rate-limit headers
+FIRECRAWL_POOL_SIZE = 20  # Pooled connections shared by all workers
+FIRECRAWL_KEEPALIVE_SECONDS = 180  # Keep idle connections open across rate-limit pauses
+
+# Epoch time before which no Firecrawl request is sent; updated from X-RateLimit-* / Retry-After headers.
+_rate_limit_resume_at = 0.0
+
+# --- PLAYWRIGHT HELPERS ---
+# Read all link hrefs in one round-trip to the browser instead of one get_attribute() call per link.
+ALL_HREFS_JS = "els => els.map(e => e.getAttribute('href'))"
+
+
+# --- FIRECRAWL PROMPT ---
+# Kept terse: prompt length drives Firecrawl's LLM latency, and the schema alone pins down the output.
+EXTRACTION_PROMPT = (
+    "Extract from this {provider} ETF product page: name (ETF full name), isin (ETF ISIN), holdings (top 10 by weight). "
+    "Return JSON matching {{name:str,isin:str,holdings:[{{name:str,sector:str,securityType:str,weight:float,isin:str}}]}}. "
+    "weight is the percentage as a float. Use 'N/A' for missing fields and [] if there are no holdings."
+)
 
 
 # --- PROVIDER-SPECIFIC LOGIC ---
 
 # 1. Vanguard
 # ---------------------------------
-VANGUARD_URL = "https://investor.vanguard.com/investment-products/list/etfs"
-VANGUARD_PROMPT = """
-Analyze the Vanguard ETF product page to extract:
-- name: ETF full name (from 'span[data-rpa-tag-id="longName"]' or 'h1[data-rpa-tag-id="dashboard-symbol"]')
-- isin: ETF ISIN code (from a div or span containing 'ISIN', often near 'Fund facts')
-For holdings:
-- Extract the top 10 holdings from the HTML table (typically under a 'Holdings' or 'Portfolio' section, e.g., 'table.holdings-table'). For each holding:
-  - name: string (from column 'Holding' or 'Name')
-  - sector: string or 'N/A' (from column 'Sector')
-  - securityType: string or 'N/A' (from column 'Asset Class' or inferred as 'Equity')
-  - weight: float (percentage, from column '% Assets' or 'Weight', convert to float)
-  - isin: string or 'N/A' (from column 'ISIN' or 'Ticker' if available)
-- If no table is found or fewer than 10 holdings are available, return as many as possible.
-- If no holdings are found, set holdings to an empty list.
-Output strictly in JSON with no additional text:
-{"name": "string", "isin": "string", "holdings": [{"name": "string", "sector": "string", "securityType": "string", "weight": float, "isin": "string"}] or []}
-"""
-
-async def handle_vanguard_consent(page):
-    print("🔎 Handling Vanguard consent process...")
-    try:
-        await page.locator('button#onetrust-accept-btn-handler').click(timeout=7000)
-        print("   - ✅ Cookies accepted.")
-        await page.wait_for_selector('.onetrust-pc-dark-filter', state='detached', timeout=5000)
-    except Exception:
-        print("   - ✓ No cookie banner found.")
-    print("✅ Vanguard consent flow complete.")
-
-async def get_vanguard_etf_urls(playwright):
-    etf_urls = []
-    print("🚀 Launching browser for Vanguard URLs...")
-    browser = await playwright.chromium.launch(headless=False, slow_mo=100)
-    page = await browser.new_page()
+# URL collection is shared with vanguard.py (see vanguard_common.py).
+VANGUARD_PROMPT = EXTRACTION_PROMPT.format(provider="Vanguard")
+async def get_vanguard_etf_urls(browser):
     try:
-        await page.goto(VANGUARD_URL, timeout=90000, wait_until="domcontentloaded")
-        await handle_vanguard_consent(page)
-        print("⏳ Waiting for Vanguard ETF list to load...")
-        await page.wait_for_selector("tr[data-rpa-tag-id]", timeout=60000)
-        while await page.locator('button:has-text("Show more")').is_visible():
-            await page.locator('button:has-text("Show more")').click()
-            await page.wait_for_load_state('networkidle', timeout=15000)
-        links = await page.locator("tr[data-rpa-tag-id] a[data-rpa-tag-id='longName']").all()
-        for link in links[:TOTAL_ETFS_TO_SCRAPE]:
-            href = await link.get_attribute("href")
-            if href:
-                etf_urls.append(urljoin(VANGUARD_URL, href))
+        return await vanguard_common.get_etf_urls(browser, TOTAL_ETFS_TO_SCRAPE)
     except Exception as e:
         print(f"❌ Failed to get Vanguard URLs: {e}")
-    finally:
-        await browser.close()
-    print(f"✅ Collected {len(etf_urls)} Vanguard ETF URLs.")
-    return etf_urls
+        return []
 
 # 2. DWS Xtrackers
 # ---------------------------------
 DWS_URL = "https://etf.dws.com/de-de/produktfinder/"
-DWS_PROMPT = """
-Analyze the DWS Xtrackers ETF product page to extract:
-- name: ETF full name (from header, typically within 'h1#product-header-title')
-- isin: ETF ISIN code (from 'div.product-header__identifier__row strong' near 'ISIN:')
-For holdings:
-- Extract the top 10 holdings from the HTML table (typically under a section with 'Top 10' or 'Wertpapiere des Wertpapierkorbs'). For each holding:
-  - name: string (from column 'Name' or 'Bezeichnung')
-  - sector: string or 'N/A' (from column 'Sektor' or 'Industry Classification')
-  - securityType: string or 'N/A' (from column 'Anlageklasse' or 'Asset Class')
-  - weight: float (percentage, from column 'Gewichtung %' or 'Gewichtung', convert to float)
-  - isin: string or 'N/A' (from column 'ISIN')
-- If no holdings are found, set holdings to an empty list.
-Output strictly in JSON with no additional text:
-{"name": "string", "isin": "string", "holdings": [{"name": "string", "sector": "string", "securityType": "string", "weight": float, "isin": "string"}] or []}
-"""
+DWS_PROMPT = EXTRACTION_PROMPT.format(provider="DWS Xtrackers")
+DWS_CONSENT_BUTTONS = [
+    ('button:has-text("Accept all cookies")', "Accept all cookies"),
+    ('button:has-text("Akzeptieren & weiter")', "Akzeptieren & weiter"),
+]
+DWS_LINK_SELECTOR = 'td a.d-base-link[href*="/de-de/LU"]'
 
 async def handle_dws_consent(page):
     print("🔎 Handling DWS consent process...")
-    try:
-        await page.locator('button:has-text("Accept all cookies")').click(timeout=10000)
-        print("   - ✅ Clicked 'Accept all cookies'.")
-        await page.wait_for_load_state('networkidle', timeout=15000)
-    except:
-        print("   - ✓ Cookie banner not found.")
-    try:
-        await page.locator('button:has-text("Akzeptieren & weiter")').click(timeout=10000)
-        print("   - ✅ Clicked 'Akzeptieren & weiter'.")
-        await page.wait_for_load_state('networkidle', timeout=15000)
-    except:
-        print("   - ✓ Disclaimer pop-up not found.")
+    await click_consent_buttons(page, DWS_CONSENT_BUTTONS, click_timeout=5000)
     print("✅ DWS consent flow complete.")
 
-async def get_dws_etf_urls(playwright):
+async def get_dws_etf_urls(browser):
     etf_urls = []
-    print("🚀 Launching browser for DWS URLs...")
-    browser = await playwright.chromium.launch(headless=False, slow_mo=50)
-    page = await browser.new_page()
+    print("🚀 Opening browser context for DWS URLs...")
+    context = await browser.new_context()
+    await context.route("**/*", block_heavy_resources)
+    page = await context.new_page()
     try:
         await page.goto(DWS_URL, timeout=90000, wait_until="domcontentloaded")
         await handle_dws_consent(page)
         print("⏳ Waiting for DWS ETF list to load...")
-        link_selector = 'td a.d-base-link[href*="/de-de/LU"]'
-        await page.wait_for_selector(link_selector, timeout=60000)
-        links = await page.locator(link_selector).all()
-        unique_urls = set()
-        for link in links:
-            href = await link.get_attribute("href")
-            if href:
-                unique_urls.add(urljoin(DWS_URL, href))
+        await page.wait_for_selector(DWS_LINK_SELECTOR, timeout=60000)
+        hrefs = await page.eval_on_selector_all(DWS_LINK_SELECTOR, ALL_HREFS_JS)
+        unique_urls = dict.fromkeys(urljoin(DWS_URL, href) for href in hrefs if href)
         etf_urls = list(unique_urls)[:TOTAL_ETFS_TO_SCRAPE]
     except Exception as e:
         print(f"❌ Failed to get DWS URLs: {e}")
     finally:
-        await browser.close()
+        await context.close()
     print(f"✅ Collected {len(etf_urls)} DWS ETF URLs.")
     return etf_urls
 
 # 3. iShares
 # ---------------------------------
-ISHARES_URL = "https://www.ishares.com/de/privatanleger/de/produkte/etf-investments#/?productView=all&pageNumber=1&sortColumn=totalFundSizeInMillions&sortDirection=desc&dataView=keyFacts&keyFacts=all"
-ISHARES_PROMPT = """
-Analyze the iShares ETF product page to extract:
-- name: ETF full name (from header, typically within 'span.product-title-main' under '#fundHeader')
-- isin: ETF ISIN code (from 'div.col-isin div.data')
-For holdings:
-- Extract the top 10 holdings from the HTML table (typically in '#tabsTen-largest' or 'table#allHoldingsTable'). For each holding:
-  - name: string (from 'td.colIssueName' or 'td.colAssetClassName')
-  - sector: string or 'N/A' (from 'td.colSector')
-  - securityType: string or 'N/A' (from 'td.colSecurityType')
-  - weight: float (percentage, from 'td.colFundPercentage', convert to float)
-  - isin: string or 'N/A' (from 'td.colIsin')
-- If no holdings are found, set holdings to an empty list.
-Output strictly in JSON with no additional text:
-{"name": "string", "isin": "string", "holdings": [{"name": "string", "sector": "string", "securityType": "string", "weight": float, "isin": "string"}] or []}
-"""
-async def get_ishares_etf_urls(playwright):
-    etf_urls = []
-    print("🚀 Launching browser for iShares URLs...")
-    browser = await playwright.chromium.launch(headless=False, slow_mo=150)
-    page = await browser.new_page()
+# URL collection is shared with Ishare.py (see ishares_common.py).
+ISHARES_PROMPT = EXTRACTION_PROMPT.format(provider="iShares")
+async def get_ishares_etf_urls(browser):
     try:
-        await page.goto(ISHARES_URL, timeout=90000)
-        try:
-            await page.locator('#onetrust-accept-btn-handler').click(timeout=10000)
-            print("✅ Cookies accepted")
-        except:
-            print("⚠️ No cookie banner found.")
-        try:
-            await page.locator('a[data-link-event="Accept t&c: individual"]:has-text("Weiter")').click(timeout=10000)
-            print("✅ Clicked Weiter")
-        except:
-            print("⚠️ No Weiter link found.")
-        print("⏳ Waiting for iShares ETF list to load...")
-        await page.wait_for_selector("a.link-to-product-page", timeout=60000)
-        links = await page.locator("a.link-to-product-page").all()
-        for link in links[:TOTAL_ETFS_TO_SCRAPE]:
-            href = await link.get_attribute("href")
-            if href:
-                clean_href = href.split('?')[0]
-                etf_urls.append(f"https://www.ishares.com{clean_href}?switchLocale=y&siteEntryPassthrough=true")
+        return await ishares_common.get_etf_urls(browser, TOTAL_ETFS_TO_SCRAPE)
     except Exception as e:
         print(f"❌ Failed to get iShares URLs: {e}")
-    finally:
-        await browser.close()
-    print(f"✅ Collected {len(etf_urls)} iShares ETF URLs.")
-    return etf_urls
+        return []
 
 # 4. Amundi
 # ---------------------------------
-AMUNDI_URL = "https://www.amundietf.de/de/professionell/etf-products/search"
-AMUNDI_PROMPT = """
-Analyze the Amundi ETF product page to extract:
-- name: ETF full name (from header, typically within 'h1.ProductHero__title' or 'h1.text-uppercase')
-- isin: ETF ISIN code (from 'div.m-isin-wkn', often within a div containing 'ISIN / WKN')
-For holdings:
-- Extract the top 10 holdings from the HTML table (typically in 'table.top-holdings' or a table under a section with 'Zusammensetzung' tab). For each holding:
-  - name: string (from first column, often the company name)
-  - sector: string or 'N/A' (from sector column)
-  - securityType: string or 'N/A' (from asset class column, if available)
-  - weight: float (percentage, from weight column, convert to float)
-  - isin: string or 'N/A' (from ISIN column, if available)
-- If no holdings are found, set holdings to an empty list.
-Output strictly in JSON with no additional text:
-{"name": "string", "isin": "string", "holdings": [{"name": "string", "sector": "string", "securityType": "string", "weight": float, "isin": "string"}] or []}
-"""
-
-async def handle_amundi_consent(page):
-    print("🔎 Handling Amundi consent process...")
+# URL collection is shared with amundietf.py (see amundi_common.py).
+AMUNDI_PROMPT = EXTRACTION_PROMPT.format(provider="Amundi")
+async def get_amundi_etf_urls(browser):
     try:
-        await page.locator('button[data-profile="INSTIT"]').click(timeout=10000)
-        print("   - ✅ Clicked 'Professioneller Anleger'.")
-        await page.wait_for_load_state('networkidle', timeout=15000)
-    except:
-        print("   - ✓ Profile selection not found.")
-    try:
-        await page.locator('button:has-text("Akzeptieren und fortfahren")').click(timeout=10000)
-        print("   - ✅ Clicked 'Akzeptieren und fortfahren'.")
-        await page.wait_for_load_state('networkidle', timeout=15000)
-    except:
-        print("   - ✓ Final acceptance pop-up not found.")
-    try:
-        await page.locator('button:has-text("Alle annehmen")').click(timeout=10000)
-        print("   - ✅ Clicked 'Alle annehmen'.")
-        await page.wait_for_load_state('networkidle', timeout=15000)
-    except:
-        print("   - ✓ Cookie banner not found.")
-    print("✅ Amundi consent flow complete.")
-
-async def get_amundi_etf_urls(playwright):
-    etf_urls = []
-    print("🚀 Launching browser for Amundi URLs...")
-    browser = await playwright.chromium.launch(headless=False, slow_mo=100)
-    page = await browser.new_page()
-    try:
-        await page.goto(AMUNDI_URL, timeout=90000)
-        await handle_amundi_consent(page)
-        print("⏳ Waiting for Amundi ETF list to load...")
-        await page.wait_for_selector("div.FinderResultsSection__Datatable table tbody tr", timeout=60000)
-        links = await page.locator("div.FinderResultsSection__Datatable table tbody tr td a").all()
-        for link in links[:TOTAL_ETFS_TO_SCRAPE]:
-            href = await link.get_attribute("href")
-            if href:
-                etf_urls.append(urljoin("https://www.amundietf.de", href))
+        return await amundi_common.get_etf_urls(browser, TOTAL_ETFS_TO_SCRAPE)
     except Exception as e:
         print(f"❌ Failed to get Amundi URLs: {e}")
-    finally:
-        await browser.close()
-    print(f"✅ Collected {len(etf_urls)} Amundi ETF URLs.")
-    return etf_urls
+        return []
+
+
+# --- OUTPUT HELPERS ---
+
+def save_json(filename, data):
+    """Writes data as indented UTF-8 JSON using orjson. Call via asyncio.to_thread from coroutines."""
+    with open(filename, "wb") as f:
+        f.write(orjson.dumps(data, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS))
+
+
+def intern_strings(obj):
+    """Recursively replaces string values with interned copies so repeated sectors, types, and ISINs share one object."""
+    if isinstance(obj, str):
+        return sys.intern(obj)
+    if isinstance(obj, dict):
+        return {sys.intern(key) if isinstance(key, str) else key: intern_strings(value) for key, value in obj.items()}
+    if isinstance(obj, list):
+        return [intern_strings(item) for item in obj]
+    return obj
 
 
 # --- GENERIC SCRAPING FUNCTION ---
 
-def scrape_etf_page(url, prompt):
+def update_rate_limit(response):
+    """Records when the next Firecrawl request may be sent, based on the rate-limit headers of a response."""
+    global _rate_limit_resume_at
+    retry_after = response.headers.get("Retry-After")
+    remaining = response.headers.get("X-RateLimit-Remaining")
+    reset = response.headers.get("X-RateLimit-Reset")
+    try:
+        if response.status == 429 and retry_after is not None:
+            _rate_limit_resume_at = max(_rate_limit_resume_at, time.time() + float(retry_after))
+        elif (response.status == 429 or remaining == "0") and reset is not None:
+            reset_value = float(reset)
+            # The reset header is either an epoch timestamp or a number of seconds until the window resets.
+            resume_at = reset_value if reset_value > 1_000_000_000 else time.time() + reset_value
+            _rate_limit_resume_at = max(_rate_limit_resume_at, resume_at)
+        elif response.status == 429:
+            _rate_limit_resume_at = max(_rate_limit_resume_at, time.time() + FIRECRAWL_DEFAULT_RETRY_AFTER_SECONDS)
+    except ValueError:
+        _rate_limit_resume_at = max(_rate_limit_resume_at, time.time() + FIRECRAWL_DEFAULT_RETRY_AFTER_SECONDS)
+
+async def wait_for_rate_limit():
+    """Sleeps until the rate-limit window recorded by update_rate_limit has reopened."""
+    delay = _rate_limit_resume_at - time.time()
+    if delay > 0:
+        print(f"⏳ Firecrawl rate limit reached. Waiting {delay:.1f} seconds...")
+        await asyncio.sleep(delay)
+
+async def request_firecrawl_scrape(session, url, prompt, actions=None):
+    """POSTs a single JSON-extraction request to Firecrawl's /v1/scrape endpoint and returns the extracted JSON."""
+    payload = {
+        "url": url,
+        "formats": ["json"],
+        "jsonOptions": {"prompt": prompt},
+        "onlyMainContent": False,
+        "excludeTags": EXCLUDED_TAGS,
+        "timeout": 120000,
+    }
+    if actions:
+        payload["actions"] = actions
+    for _ in range(FIRECRAWL_MAX_RATE_LIMIT_RETRIES):
+        await wait_for_rate_limit()
+        async with session.post(FIRECRAWL_SCRAPE_URL, json=payload, timeout=aiohttp.ClientTimeout(total=150)) as response:
+            update_rate_limit(response)
+            if response.status == 429:
+                continue
+            response.raise_for_status()
+            body = await response.json(loads=orjson.loads)
+        if not body.get("success"):
+            raise RuntimeError(body.get("error", "Firecrawl reported an unsuccessful scrape."))
+        return (body.get("data") or {}).get("json")
+    raise RuntimeError(f"Still rate limited by Firecrawl after {FIRECRAWL_MAX_RATE_LIMIT_RETRIES} attempts.")
+
+async def scrape_etf_page(session, url, prompt):
     """
     Generic function to scrape an ETF page using Firecrawl with a specific prompt.
+    Requests go straight to the Firecrawl API over the shared aiohttp session; failed attempts
+    are retried with a wait action and exponential backoff.
+    Results are served from the on-disk cache when available.
     """
+    if USE_CACHE:
+        cached_result = await asyncio.to_thread(load_cached_result, url, prompt)
+        if cached_result is not None:
+            print(f"💾 Using cached result for {url}.")
+            return cached_result
+
     print(f"📄 Processing {url} with Firecrawl...")
-    formats = [{"type": "json", "prompt": prompt}]
-    try:
-        result = app.scrape(url, formats=formats, only_main_content=False, timeout=120000)
-    except Exception as e:
-        print(f"❌ Scrape failed: {e}. Retrying with a wait action...")
+    data = None
+    for attempt in range(FIRECRAWL_MAX_ATTEMPTS):
+        actions = [{"type": "wait", "milliseconds": 5000}] if attempt > 0 else None
         try:
-            result = app.scrape(url, formats=formats, actions=[{"type": "wait", "milliseconds": 5000}], only_main_content=False, timeout=120000)
-        except Exception as e2:
-            print(f"❌ Scrape retry also failed: {e2}.")
-            return None
-
-    try:
-        if hasattr(result, 'json'):
-            data = result.json
-            etf_name = data.get('name', 'Unknown')
-            etf_isin = data.get('isin', 'Unknown')
-            holdings = data.get('holdings', [])
-            if not holdings:
-                print("⚠️ No holdings were extracted from the page.")
-            print(f"✅ Extracted data for {etf_name} ({len(holdings)} holdings).")
-            return {"isin": etf_isin, "name": etf_name, "holdings": holdings[:10]}
-        else:
-            raise AttributeError("Result object has no 'json' attribute.")
-    except (AttributeError, json.JSONDecodeError, TypeError) as e:
-        print(f"❌ Failed to parse extracted JSON from Firecrawl: {e}.")
+            data = await request_firecrawl_scrape(session, url, prompt, actions)
+            break
+        except (aiohttp.ClientError, asyncio.TimeoutError, RuntimeError, ValueError) as e:
+            if attempt + 1 == FIRECRAWL_MAX_ATTEMPTS:
+                print(f"❌ Scrape failed after {FIRECRAWL_MAX_ATTEMPTS} attempts: {e}.")
+                return None
+            backoff_seconds = 2 ** attempt
+            print(f"❌ Scrape failed: {e}. Retrying with a wait action in {backoff_seconds}s...")
+            await asyncio.sleep(backoff_seconds)
+
+    if not isinstance(data, dict):
+        print("❌ Firecrawl returned no extracted JSON for this page.")
         return None
 
+    etf_name = data.get('name', 'Unknown')
+    etf_isin = data.get('isin', 'Unknown')
+    holdings = data.get('holdings') or []
+    if not holdings:
+        print("⚠️ No holdings were extracted from the page.")
+    print(f"✅ Extracted data for {etf_name} ({len(holdings)} holdings).")
+    scrape_result = {"isin": etf_isin, "name": etf_name, "holdings": holdings[:10]}
+    # Only complete results are cached (see save_cached_result); a bad extraction would otherwise be replayed until the entry expires.
+    await asyncio.to_thread(save_cached_result, url, prompt, scrape_result)
+    return scrape_result
+
+# --- CHECKPOINTS ---
+
+def get_checkpoint_path(output_dir, provider):
+    """Returns the checkpoint file that records a provider's finished URLs and ISINs."""
+    return os.path.join(output_dir, f"checkpoint_{provider['filename_prefix']}.json")
+
+def load_checkpoint(output_dir, provider):
+    """Loads a provider's checkpoint, or returns an empty one if no interrupted run left one behind."""
+    path = get_checkpoint_path(output_dir, provider)
+    checkpoint = {"done_urls": set()}
+    if os.path.exists(path):
+        try:
+            with open(path, "rb") as f:
+                stored = orjson.loads(f.read())
+            checkpoint["done_urls"] = set(stored.get("done_urls", []))
+        except (OSError, orjson.JSONDecodeError) as e:
+            print(f"⚠️ Ignoring unreadable checkpoint {path}: {e}")
+    return checkpoint
+
+def save_checkpoint(output_dir, provider, checkpoint):
+    """Atomically rewrites a provider's checkpoint so an interrupted write never leaves a corrupt file."""
+    path = get_checkpoint_path(output_dir, provider)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(orjson.dumps({"done_urls": sorted(checkpoint["done_urls"])}))
+    os.replace(tmp_path, path)
+
+# --- STREAMED RESULTS ---
+
+def get_stream_path(output_dir, provider):
+    """Returns the NDJSON file that a provider's scraped ETFs are appended to while the run is in progress."""
+    return os.path.join(output_dir, f"{provider['filename_prefix']}_partial.ndjson")
+
+def append_stream_record(output_dir, provider, url, record):
+    """Appends one scraped ETF as a single {"url", "data"} NDJSON line, the record shape all scrapers stream."""
+    with open(get_stream_path(output_dir, provider), "ab") as f:
+        append_record(f, url, record)
+
+def load_stream_records(output_dir, provider):
+    """Reads a provider's NDJSON stream back into an ISIN-keyed dict, skipping any unreadable line."""
+    path = get_stream_path(output_dir, provider)
+    if not os.path.exists(path):
+        return {}
+    return {record["isin"]: intern_strings(record) for _, record in read_stream(path)}
+
+
+async def produce_urls(provider, browser, queue, checkpoint):
+    """Collects a provider's ETF URLs and enqueues the unfinished ones for the scrape workers as soon as they are known."""
+    urls = await provider["get_urls_func"](browser)
+    if not urls:
+        print(f"No URLs found for {provider['name']}. Skipping this provider.")
+    pending_urls = [url for url in urls if url not in checkpoint["done_urls"]]
+    if len(pending_urls) < len(urls):
+        print(f"⏭️ Skipping {len(urls) - len(pending_urls)} {provider['name']} ETFs already finished in a previous run.")
+    for url in pending_urls:
+        await queue.put((provider, url))
+    return len(pending_urls)
+
+async def scrape_worker(queue, session, checkpoints, output_dir):
+    """Pulls (provider, url) jobs off the queue and scrapes them until a None sentinel arrives."""
+    while True:
+        job = await queue.get()
+        try:
+            if job is None:
+                return
+            provider, url = job
+            scrape_result = await scrape_etf_page(session, url, provider["prompt"])
+            if scrape_result and scrape_result.get("isin") not in MISSING_ISIN_VALUES:
+                # Written synchronously: each write is small, and the record must be on disk before the checkpoint.
+                append_stream_record(output_dir, provider, url, scrape_result)
+                print(f"📊 Successfully processed {scrape_result.get('name', 'N/A')} ({provider['name']})")
+                checkpoint = checkpoints[provider["name"]]
+                checkpoint["done_urls"].add(url)
+                save_checkpoint(output_dir, provider, checkpoint)
+            else:
+                print(f"❌ Failed to process {url} or essential data (like ISIN) was missing.")
+        except Exception as e:
+            print(f"❌ Unexpected error while processing {job[1]}: {e}")
+        finally:
+            queue.task_done()
+
 
 # --- MAIN ORCHESTRATOR ---
 
 async def main():
     """
     Main function to orchestrate the scraping process for all configured providers.
+    URL collection (producers) and Firecrawl scraping (workers) overlap through an asyncio.Queue.
     """
     # --- ADD THIS SECTION ---
     # Define the output directory and create it if it doesn't exist
@@ -327,48 +363,84 @@ async def main():
     ]
 
     all_providers_data = {}
-
-    async with async_playwright() as p:
-        for provider in providers:
-            print(f"\n{'='*20} Starting Scraper for {provider['name'].upper()} {'='*20}")
-
-            urls = await provider["get_urls_func"](p)
-            if not urls:
-                print(f"No URLs found for {provider['name']}. Skipping to next provider.")
-                continue
-
-            provider_json_output = {}
-            for i, url in enumerate(urls):
-                print(f"\n--- Processing ETF {i + 1}/{len(urls)} for {provider['name']} ---")
-                scrape_result = scrape_etf_page(url, provider["prompt"])
-
-                if scrape_result and scrape_result.get("isin") not in [None, "Unknown", ""]:
-                    provider_json_output[scrape_result["isin"]] = scrape_result
-                    print(f"📊 Successfully processed {scrape_result.get('name', 'N/A')}")
-                else:
-                    print(f"❌ Failed to process {url} or essential data (like ISIN) was missing.")
-
-                is_last_item = (i + 1) == len(urls)
-                if (i + 1) % BATCH_SIZE == 0 and not is_last_item:
-                    print(f"\n✅ Batch of {BATCH_SIZE} complete. Waiting for {DELAY_BETWEEN_BATCHES_SECONDS} seconds...")
-                    await asyncio.sleep(DELAY_BETWEEN_BATCHES_SECONDS)
-
-            # Step 3: Save individual provider file and store data in the master dictionary
-            if provider_json_output:
-                timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-                
-                # --- CHANGE THIS LINE ---
-                # Prepend the output directory to the filename
-                filename = os.path.join(OUTPUT_DIR, f"{provider['filename_prefix']}_{timestamp}.json")
-                # --- END OF CHANGE ---
-
-                with open(filename, "w", encoding="utf-8") as f:
-                    json.dump(provider_json_output, f, indent=2, ensure_ascii=False)
-                print(f"\n✅ Saved individual file for {provider['name']} to {filename}.")
-
-                all_providers_data[provider['name']] = provider_json_output
-            else:
-                print(f"\n❌ No ETFs were scraped successfully for {provider['name']}.")
+    checkpoints = {}
+    for provider in providers:
+        checkpoint = load_checkpoint(OUTPUT_DIR, provider) if RESUME else {"done_urls": set()}
+        checkpoints[provider["name"]] = checkpoint
+        stream_path = get_stream_path(OUTPUT_DIR, provider)
+        if checkpoint["done_urls"]:
+            print(f"♻️ Resuming {provider['name']}: {len(checkpoint['done_urls'])} ETFs kept from the previous run.")
+            if os.path.exists(stream_path):
+                repair_stream(stream_path)
+        elif os.path.exists(stream_path):
+            os.remove(stream_path)
+    queue = asyncio.Queue()
+
+    # Step 1: Start the Firecrawl workers, then collect the ETF URLs of all providers concurrently.
+    # A single browser is shared; each collector works in its own context and feeds the queue.
+    # One session for every scrape: pooled keep-alive connections to api.firecrawl.dev skip repeated TLS handshakes.
+    async with aiohttp.ClientSession(
+        connector=aiohttp.TCPConnector(
+            limit=FIRECRAWL_POOL_SIZE,
+            limit_per_host=FIRECRAWL_POOL_SIZE,
+            keepalive_timeout=FIRECRAWL_KEEPALIVE_SECONDS,
+            ttl_dns_cache=300,
+        ),
+        headers={"Authorization": f"Bearer {FIRECRAWL_API_KEY}"},
+    ) as session:
+        workers = [
+            asyncio.create_task(scrape_worker(queue, session, checkpoints, OUTPUT_DIR))
+            for _ in range(MAX_CONCURRENT_SCRAPES)
+        ]
+        try:
+            async with async_playwright() as p:
+                print("\n🚀 Launching browser to collect ETF URLs for all providers in parallel...")
+                browser = await p.chromium.launch(
+                    headless=os.environ.get("SHOW_BROWSER") != "1",
+                    slow_mo=int(os.environ.get("PW_SLOWMO", "0")),
+                )
+                try:
+                    url_counts = await asyncio.gather(
+                        *(produce_urls(provider, browser, queue, checkpoints[provider["name"]]) for provider in providers),
+                        return_exceptions=True,
+                    )
+                finally:
+                    await browser.close()
+
+            for provider, url_count in zip(providers, url_counts):
+                if isinstance(url_count, Exception):
+                    print(f"❌ URL collection for {provider['name']} failed: {url_count}")
+
+            # Step 2: Wait for the workers to drain the queue, then shut them down
+            print(f"\n⏳ Waiting for {MAX_CONCURRENT_SCRAPES} Firecrawl workers to finish the remaining ETFs...")
+            await queue.join()
+            for _ in workers:
+                await queue.put(None)
+            await asyncio.gather(*workers)
+        finally:
+            # If the browser failed to launch or the run was interrupted, stop the workers before the session closes.
+            for worker in workers:
+                worker.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+
+    for provider in providers:
+        print(f"\n{'='*20} Results for {provider['name'].upper()} {'='*20}")
+        # Step 3: Consolidate the streamed NDJSON into the individual provider file and the master dictionary
+        provider_json_output = await asyncio.to_thread(load_stream_records, OUTPUT_DIR, provider)
+        if provider_json_output:
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            
+            # --- CHANGE THIS LINE ---
+            # Prepend the output directory to the filename
+            filename = os.path.join(OUTPUT_DIR, f"{provider['filename_prefix']}_{timestamp}.json")
+            # --- END OF CHANGE ---
+
+            await asyncio.to_thread(save_json, filename, provider_json_output)
+            print(f"\n✅ Saved individual file for {provider['name']} to {filename}.")
+
+            all_providers_data[provider['name']] = provider_json_output
+        else:
+            print(f"\n❌ No ETFs were scraped successfully for {provider['name']}.")
 
     # Step 4: After the loop, save the combined JSON file
     print("\n" + "="*50)
@@ -383,13 +455,25 @@ async def main():
         combined_filename = os.path.join(OUTPUT_DIR, f"combined_etf_data_{timestamp}.json")
         # --- END OF CHANGE ---
 
-        with open(combined_filename, "w", encoding="utf-8") as f:
-            json.dump(all_providers_data, f, indent=2, ensure_ascii=False)
+        await asyncio.to_thread(save_json, combined_filename, all_providers_data)
         print(f"\n🎉 SUCCESS! All provider data has been combined and saved to: {combined_filename}")
+
+        # The run finished and its output is on disk, so the next run starts fresh.
+        for provider in providers:
+            for path in (get_checkpoint_path(OUTPUT_DIR, provider), get_stream_path(OUTPUT_DIR, provider)):
+                if os.path.exists(path):
+                    os.remove(path)
     else:
         print("\n❌ No data was collected from any provider. No combined file was created.")
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Scrape ETF holdings from Vanguard, DWS, iShares, and Amundi.")
+    parser.add_argument("--no-cache", action="store_true", help="Ignore cached Firecrawl results and scrape every page again.")
+    parser.add_argument("--no-resume", action="store_true", help="Ignore checkpoints left by an interrupted run.")
+    args = parser.parse_args()
+    USE_CACHE = not args.no_cache
+    RESUME = not args.no_resume
+
     if FIRECRAWL_API_KEY == "FIRECRAWL_API_KEY":
         print("⚠️ WARNING: You are using a placeholder Firecrawl API key.")
         print("   Please replace it with your own key or set the FIRECRAWL_API_KEY environment variable.")
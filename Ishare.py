@@ -6,17 +6,19 @@ Uses Playwright for collecting ETF URLs (classic method), and Firecrawl to extra
 Extracts data directly from the page's table (e.g., '#tabsTen-largest') without using CSV downloads.
 
 Requirements:
-- pip install playwright firecrawl-py
+- pip install playwright firecrawl-py orjson
 - playwright install
 - Set FIRECRAWL_API_KEY as an environment variable (sign up at firecrawl.dev for a key)
 
 WARNING: Do not hardcode API keys in scripts. Use environment variables for security.
 """
 import asyncio
-import json
+import orjson
 import os
 from datetime import datetime
 from playwright.async_api import async_playwright
+from ishares_common import get_etf_urls
+from scraper_common import EXCLUDED_TAGS, MISSING_ISIN_VALUES, load_cached_result, save_cached_result
 
 # --- CONFIGURATION ---
 TOTAL_ETFS_TO_SCRAPE = 1  # Set back to 5
@@ -24,91 +26,40 @@ BATCH_SIZE = 5
 DELAY_BETWEEN_BATCHES_SECONDS = 25
 # --- END CONFIGURATION ---
 
-ISHARES_URL = "https://www.ishares.com/de/privatanleger/de/produkte/etf-investments#/?productView=all&pageNumber=1&sortColumn=totalFundSizeInMillions&sortDirection=desc&dataView=keyFacts&keyFacts=all"
-
-from firecrawl import FirecrawlApp
-app = FirecrawlApp(api_key="FIRECRAWL_API_KEY")
-
-async def get_etf_urls():
-    """Navigate iShares ETF list and collect product page URLs using Playwright."""
-    etf_urls = []
-    print("🚀 Launching browser to collect ETF URLs...")
-    async with async_playwright() as p:
-        browser = await p.chromium.launch(headless=False, slow_mo=150)
-        page = await browser.new_page()
-        await page.goto(ISHARES_URL, timeout=90000)
-
-        try:
-            await page.locator('#onetrust-accept-btn-handler').click(timeout=10000)
-            print("✅ Cookies accepted")
-        except:
-            print("⚠️ No cookie banner found.")
-
-        try:
-            await page.locator('a[data-link-event="Accept t&c: individual"]:has-text("Weiter")').click(timeout=10000)
-            print("✅ Clicked Weiter")
-        except:
-            print("⚠️ No Weiter link found.")
-
-        print(f"⏳ Waiting for ETF list to load to collect the top {TOTAL_ETFS_TO_SCRAPE} URLs...")
-        await page.wait_for_selector("a.link-to-product-page", timeout=60000)
-        links = await page.locator("a.link-to-product-page").all()
-
-        for link in links[:TOTAL_ETFS_TO_SCRAPE]:
-            href = await link.get_attribute("href")
-            if href:
-                clean_href = href.split('?')[0]
-                url = f"https://www.ishares.com{clean_href}?switchLocale=y&siteEntryPassthrough=true"
-                etf_urls.append(url)
-
-        await browser.close()
-    print(f"✅ Collected {len(etf_urls)} ETF URLs to be processed.")
-    return etf_urls
-
-def scrape_etf_page(url):
+from firecrawl import AsyncFirecrawl
+# One async client for the whole run: its pooled HTTP connections are reused by every scrape.
+app = AsyncFirecrawl(api_key="FIRECRAWL_API_KEY")
+
+EXTRACTION_PROMPT = (
+    "Extract from this iShares ETF product page: name (ETF full name, '#fundHeader span.product-title-main'), "
+    "isin ('div.col-isin div.data'), holdings (top 10 from '#tabsTen-largest' or 'table#allHoldingsTable'). "
+    "Return JSON matching {name:str,isin:str,holdings:[{name:str,sector:str,securityType:str,weight:float,isin:str}]}. "
+    "weight is the percentage as a float. Use 'N/A' for missing fields and [] if there are no holdings."
+)
+async def scrape_etf_page(url):
     """Use Firecrawl to extract name, ISIN, and top 10 holdings from the ETF page's HTML table."""
     print(f"📄 Processing {url}...")
-    prompt = """
-Analyze the iShares ETF product page to extract:
-
-- name: ETF full name (from header, typically within 'span.product-title-main' under '#fundHeader')
-- isin: ETF ISIN code (from 'div.col-isin div.data')
+    prompt = EXTRACTION_PROMPT
+    cached_result = await asyncio.to_thread(load_cached_result, url, prompt)
+    if cached_result:
+        print(f"💾 Using cached result for {url}")
+        return cached_result
 
-For holdings:
-- Extract the top 10 holdings from the HTML table (typically in '#tabsTen-largest' or 'table#allHoldingsTable'). For each holding:
-  - name: string (from 'td.colIssueName' or 'td.colAssetClassName')
-  - sector: string or 'N/A' (from 'td.colSector')
-  - securityType: string or 'N/A' (from 'td.colSecurityType')
-  - weight: float (percentage, from 'td.colFundPercentage', convert to float)
-  - isin: string or 'N/A' (from 'td.colIsin')
-- If no table is found or fewer than 10 holdings are available, return as many as possible.
-- If no holdings are found, set holdings to an empty list.
-
-Output strictly in JSON with no additional text:
-{"name": "string", "isin": "string", "holdings": [{"name": "string", "sector": "string", "securityType": "string", "weight": float, "isin": "string"}] or []}
-"""
     formats = [{"type": "json", "prompt": prompt}]
     try:
-        result = app.scrape(url, formats=formats, only_main_content=False, timeout=120000)
-        print(f"🔍 Firecrawl result keys: {dir(result)}")  # Debug: Show available attributes
-        print(f"🔍 Firecrawl json attribute: {getattr(result, 'json', 'Not found')}")
+        result = await app.scrape(url, formats=formats, only_main_content=False, exclude_tags=EXCLUDED_TAGS, timeout=120000)
     except Exception as e:
         print(f"❌ Scrape failed: {e}. Retrying with minimal wait.")
         try:
-            result = app.scrape(url, formats=formats, actions=[{"type": "wait", "milliseconds": 5000}], only_main_content=False, timeout=120000)
-            print(f"🔍 Firecrawl retry result: {getattr(result, 'json', 'Not found')}")
+            result = await app.scrape(url, formats=formats, actions=[{"type": "wait", "milliseconds": 5000}], only_main_content=False, exclude_tags=EXCLUDED_TAGS, timeout=120000)
         except Exception as e2:
             print(f"❌ Scrape retry failed: {e2}.")
             return None
     
     # Access json as attribute (Firecrawl SDK returns ScrapeResult object)
-    try:
-        if hasattr(result, 'json'):
-            data = result.json
-        else:
-            raise AttributeError("No 'json' attribute in result")
-    except (AttributeError, json.JSONDecodeError) as e:
-        print(f"❌ Failed to parse extracted JSON: {e}. Result attributes: {dir(result)}")
+    data = getattr(result, 'json', None)
+    if not isinstance(data, dict):
+        print("❌ Firecrawl returned no extracted JSON.")
         return None
     
     etf_name = data.get('name', 'Unknown')
@@ -118,37 +69,58 @@ Output strictly in JSON with no additional text:
     if not holdings:
         print("⚠️ No holdings extracted from table.")
         return None
+    if etf_isin in MISSING_ISIN_VALUES:
+        print("⚠️ No ISIN extracted from the page.")
+        return None
     
     print(f"✅ Extracted {len(holdings)} holdings from table.")
-    return {"isin": etf_isin, "name": etf_name, "holdings": holdings[:10]}  # Limit to top 10 holdings
+    scrape_result = {"isin": etf_isin, "name": etf_name, "holdings": holdings[:10]}  # Limit to top 10 holdings
+    await asyncio.to_thread(save_cached_result, url, prompt, scrape_result)
+    return scrape_result
 
 async def main():
-    urls = await get_etf_urls()
+    print("🚀 Launching browser...")
+    async with async_playwright() as p:
+        browser = await p.chromium.launch(
+            headless=os.environ.get("SHOW_BROWSER") != "1",
+            slow_mo=int(os.environ.get("PW_SLOWMO", "0")),
+        )
+        try:
+            urls = await get_etf_urls(browser, TOTAL_ETFS_TO_SCRAPE)
+        finally:
+            await browser.close()
     if not urls:
         print("No ETFs found, exiting.")
         return
 
     final_json_output = {}
-    for i, url in enumerate(urls):
-        print(f"\n--- Processing ETF {i + 1}/{len(urls)} ---")
-        
-        scrape_result = scrape_etf_page(url)
-        if scrape_result and scrape_result.get("isin"):
-            final_json_output[scrape_result["isin"]] = scrape_result
-            print(f"📊 Processed {scrape_result['name']} ({len(scrape_result['holdings'])} holdings)")
-        else:
-            print(f"❌ Failed to process {url} or no data returned.")
-        
-        is_last_item = (i + 1) == len(urls)
-        if (i + 1) % BATCH_SIZE == 0 and not is_last_item:
+    for start in range(0, len(urls), BATCH_SIZE):
+        batch = urls[start:start + BATCH_SIZE]
+        print(f"\n--- Processing ETFs {start + 1}-{start + len(batch)}/{len(urls)} concurrently ---")
+
+        results = await asyncio.gather(
+            *(scrape_etf_page(url) for url in batch),
+            return_exceptions=True,
+        )
+        for url, scrape_result in zip(batch, results):
+            if isinstance(scrape_result, Exception):
+                print(f"❌ Unexpected error while processing {url}: {scrape_result}")
+            elif scrape_result and scrape_result.get("isin") not in MISSING_ISIN_VALUES:
+                final_json_output[scrape_result["isin"]] = scrape_result
+                print(f"📊 Processed {scrape_result['name']} ({len(scrape_result['holdings'])} holdings)")
+            else:
+                print(f"❌ Failed to process {url} or no data returned.")
+
+        is_last_batch = start + BATCH_SIZE >= len(urls)
+        if not is_last_batch:
             print(f"\n✅ Batch of {BATCH_SIZE} complete. Waiting for {DELAY_BETWEEN_BATCHES_SECONDS} seconds...")
             await asyncio.sleep(DELAY_BETWEEN_BATCHES_SECONDS)
 
     if final_json_output:
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         filename = f"ishares_data_{timestamp}.json"
-        with open(filename, "w", encoding="utf-8") as f:
-            json.dump(final_json_output, f, indent=2, ensure_ascii=False)
+        with open(filename, "wb") as f:
+            f.write(orjson.dumps(final_json_output, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS))
         print(f"\n✅ Done! Scraped {len(final_json_output)} ETFs and saved to {filename}.")
     else:
         print("\n❌ No ETFs were scraped successfully.")
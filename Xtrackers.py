@@ -6,49 +6,91 @@ Uses Playwright for collecting ETF URLs, and Firecrawl to extract name, ISIN, an
 Extracts data directly from the page's table (e.g., under 'Top 10' or 'Wertpapiere des Wertpapierkorbs') without using CSV downloads.
 
 Requirements:
-- pip install playwright firecrawl-py
+- pip install playwright firecrawl-py orjson
 - playwright install
 - Set FIRECRAWL_API_KEY as an environment variable (sign up at firecrawl.dev for a key)
 
 WARNING: Do not hardcode API keys in scripts. Use environment variables for security.
 """
 import asyncio
-import json
 import os
+import threading
 from datetime import datetime
 from playwright.async_api import async_playwright
-from urllib.parse import urljoin
+from scraper_common import (
+    CACHE_MAX_AGE_HOURS, EXCLUDED_TAGS, FIRECRAWL_BURST, FIRECRAWL_REQUESTS_PER_MINUTE, MISSING_ISIN_VALUES,
+    TokenBucket, append_record, block_heavy_resources, consolidate_stream, load_cached_result, load_done_urls,
+    save_cached_result,
+)
 
 # --- CONFIGURATION ---
 TOTAL_ETFS_TO_SCRAPE = 2  # Set back to 5
-BATCH_SIZE = 1
-DELAY_BETWEEN_BATCHES_SECONDS = 60
+MAX_CONCURRENT_SCRAPES = 10  # ETF pages processed at the same time (cache hits never touch the API)
+FIRECRAWL_CONCURRENCY = 5  # Firecrawl requests in flight at once; match your plan's concurrent browser limit
+# enabled: read and write the cache; replay: only read it, expired entries included, and fail on a miss (no API calls);
+# disabled: bypass it
+CACHE_MODE = os.environ.get("FIRECRAWL_CACHE_MODE", "enabled")
+JSONL_FILENAME = "dws_etf_data_partial.jsonl"  # Results are streamed here while the run is in progress
 # --- END CONFIGURATION ---
 
+CACHE_MODES = {"enabled", "replay", "disabled"}
+if CACHE_MODE not in CACHE_MODES:
+    raise ValueError(f"Unknown FIRECRAWL_CACHE_MODE '{CACHE_MODE}'. Use one of: {', '.join(sorted(CACHE_MODES))}.")
+
 DWS_URL = "https://etf.dws.com/de-de/produktfinder/"
+ETF_LINK_SELECTOR = 'td a.d-base-link[href*="/de-de/LU"]'
+UNIQUE_HREFS_JS = "([sel, n]) => [...new Set(Array.from(document.querySelectorAll(sel), a => a.href))].slice(0, n)"
+BROWSER_PROFILE_DIR = "./chrome_profile"  # Delete to start over with a fresh browser profile
+DWS_CONSENT_COOKIE = "OptanonAlertBoxClosed"  # Set by the OneTrust banner only once it has been answered
 
 from firecrawl import FirecrawlApp
 app = FirecrawlApp(api_key="FIRECRAWL_API_KEY")
 
-async def handle_consent_flow(page):
-    """Handles the consent and disclaimer pop-ups sequentially."""
-    print("🔎 Handling consent process...")
-    try:
-        cookie_selector = 'button:has-text("Accept all cookies")'
-        print("   - Waiting for cookie banner...")
-        await page.locator(cookie_selector).click(timeout=10000)
-        print("   - ✅ Clicked 'Accept all cookies'.")
-        await page.wait_for_load_state('networkidle', timeout=15000)
-    except:
-        print("   - ✓ Cookie banner not found (Step 1 skipped).")
+EXTRACTION_PROMPT = """
+Analyze the DWS Xtrackers ETF product page to extract:
+
+- name: ETF full name (from header, typically within 'h1#product-header-title')
+- isin: ETF ISIN code (from 'div.product-header__identifier__row strong' near 'ISIN:')
+
+For holdings:
+- Extract the top 10 holdings from the HTML table (typically under a section with 'Top 10' or 'Wertpapiere des Wertpapierkorbs'). For each holding:
+  - name: string (from column 'Name' or 'Bezeichnung')
+  - sector: string or 'N/A' (from column 'Sektor' or 'Industry Classification')
+  - securityType: string or 'N/A' (from column 'Anlageklasse' or 'Asset Class')
+  - weight: float (percentage, from column 'Gewichtung %' or 'Gewichtung', convert to float)
+  - isin: string or 'N/A' (from column 'ISIN')
+- If no table is found or fewer than 10 holdings are available, return as many as possible.
+- If no holdings are found, set holdings to an empty list.
+
+Output strictly in JSON with no additional text:
+{"name": "string", "isin": "string", "holdings": [{"name": "string", "sector": "string", "securityType": "string", "weight": float, "isin": "string"}] or []}
+"""
+
+async def click_if_present(page, selector, label, timeout):
+    """Clicks a pop-up button if it shows up within the timeout and reports whether it did."""
     try:
-        accept_selector = 'button:has-text("Akzeptieren & weiter")'
-        print("   - Waiting for disclaimer pop-up...")
-        await page.locator(accept_selector).click(timeout=10000)
-        print("   - ✅ Clicked 'Akzeptieren & weiter'.")
-        await page.wait_for_load_state('networkidle', timeout=15000)
-    except:
-        print("   - ✓ Disclaimer pop-up not found (Step 2 skipped).")
+        await page.locator(selector).click(timeout=timeout)
+        print(f"   - ✅ Clicked '{label}'.")
+        return True
+    except Exception:
+        print(f"   - ✓ '{label}' not found.")
+        return False
+
+async def handle_consent_flow(page, timeout=10000):
+    """Races the consent and disclaimer clicks against the ETF list itself becoming readable."""
+    print("🔎 Handling consent process...")
+    clicks = asyncio.ensure_future(asyncio.gather(
+        click_if_present(page, 'button:has-text("Accept all cookies")', "Accept all cookies", timeout),
+        click_if_present(page, 'button:has-text("Akzeptieren & weiter")', "Akzeptieren & weiter", timeout),
+    ))
+    # Only the link hrefs are read, so once the rows are in the DOM the banners no longer matter.
+    list_ready = asyncio.ensure_future(page.wait_for_selector(ETF_LINK_SELECTOR, timeout=timeout))
+    done, pending = await asyncio.wait({clicks, list_ready}, return_when=asyncio.FIRST_COMPLETED)
+    if list_ready in done and not list_ready.exception():
+        print("   - ✓ ETF list is already readable; skipping the remaining pop-ups.")
+    for task in pending:
+        task.cancel()
+    await asyncio.gather(*pending, return_exceptions=True)
     print("✅ Consent flow complete.")
 
 async def get_etf_urls():
@@ -56,79 +98,74 @@ async def get_etf_urls():
     etf_urls = []
     print("🚀 Launching browser to collect ETF URLs...")
     async with async_playwright() as p:
-        browser = await p.chromium.launch(headless=False, slow_mo=50)
-        page = await browser.new_page()
+        # A persistent profile keeps the consent cookies between runs, so once consent has been given the
+        # banners are gone and the consent clicks only need a short timeout. The profile directory alone
+        # is not enough: a run that failed before accepting the banner leaves it behind without the cookie.
+        browser = await p.chromium.launch_persistent_context(
+            BROWSER_PROFILE_DIR,
+            headless=True,
+            slow_mo=int(os.environ.get("PW_SLOWMO", "0")),
+        )
+        has_consent = any(cookie["name"] == DWS_CONSENT_COOKIE for cookie in await browser.cookies(DWS_URL))
+        await browser.route("**/*", block_heavy_resources)
+        page = browser.pages[0] if browser.pages else await browser.new_page()
         await page.goto(DWS_URL, timeout=90000, wait_until="domcontentloaded")
         
-        await handle_consent_flow(page)
+        await handle_consent_flow(page, timeout=2000 if has_consent else 10000)
         
         print("⏳ Waiting for ETF list to load...")
-        link_selector = 'td a.d-base-link[href*="/de-de/LU"]'
         try:
             print("   - Waiting for ETF data rows to render...")
-            await page.wait_for_selector(link_selector, timeout=60000)
+            await page.wait_for_selector(ETF_LINK_SELECTOR, timeout=60000)
             print("✅ ETF data rows loaded.")
         except:
             print("❌ Timed out waiting for ETF data rows to appear. The page structure may have changed.")
             await browser.close()
             return []
         
-        links = await page.locator(link_selector).all()
-        unique_urls = set()
-        for link in links:
-            href = await link.get_attribute("href")
-            if href:
-                full_url = urljoin(DWS_URL, href)
-                unique_urls.add(full_url)
-        
-        etf_urls = list(unique_urls)[:TOTAL_ETFS_TO_SCRAPE]
+        # One round-trip: a.href is already absolute, and the Set keeps the first occurrence of each URL in page order.
+        etf_urls = await page.evaluate(UNIQUE_HREFS_JS, [ETF_LINK_SELECTOR, TOTAL_ETFS_TO_SCRAPE])
         await browser.close()
     print(f"✅ Collected {len(etf_urls)} unique ETF URLs.")
     return etf_urls
 
+rate_limiter = TokenBucket(FIRECRAWL_REQUESTS_PER_MINUTE, FIRECRAWL_BURST)
+# Caps in-flight Firecrawl requests separately from the overall scrape concurrency; the bucket above sets the pace.
+firecrawl_slots = threading.BoundedSemaphore(FIRECRAWL_CONCURRENCY)
+
 def scrape_etf_page(url):
     """Use Firecrawl to extract name, ISIN, and top 10 holdings from the ETF page's HTML table."""
     print(f"📄 Processing {url}...")
-    prompt = """
-Analyze the DWS Xtrackers ETF product page to extract:
-
-- name: ETF full name (from header, typically within 'h1#product-header-title')
-- isin: ETF ISIN code (from 'div.product-header__identifier__row strong' near 'ISIN:')
-
-For holdings:
-- Extract the top 10 holdings from the HTML table (typically under a section with 'Top 10' or 'Wertpapiere des Wertpapierkorbs'). For each holding:
-  - name: string (from column 'Name' or 'Bezeichnung')
-  - sector: string or 'N/A' (from column 'Sektor' or 'Industry Classification')
-  - securityType: string or 'N/A' (from column 'Anlageklasse' or 'Asset Class')
-  - weight: float (percentage, from column 'Gewichtung %' or 'Gewichtung', convert to float)
-  - isin: string or 'N/A' (from column 'ISIN')
-- If no table is found or fewer than 10 holdings are available, return as many as possible.
-- If no holdings are found, set holdings to an empty list.
+    prompt = EXTRACTION_PROMPT
+    if CACHE_MODE != "disabled":
+        # Replay must work without the API, so it serves entries of any age.
+        cached_result = load_cached_result(url, prompt, None if CACHE_MODE == "replay" else CACHE_MAX_AGE_HOURS)
+        if cached_result:
+            print(f"💾 Using cached result for {url}")
+            return cached_result
+        if CACHE_MODE == "replay":
+            print(f"❌ No cached result for {url} (FIRECRAWL_CACHE_MODE=replay).")
+            return None
 
-Output strictly in JSON with no additional text:
-{"name": "string", "isin": "string", "holdings": [{"name": "string", "sector": "string", "securityType": "string", "weight": float, "isin": "string"}] or []}
-"""
     formats = [{"type": "json", "prompt": prompt}]
     try:
-        result = app.scrape(url, formats=formats, only_main_content=False, timeout=120000)
-        print(f"🔍 Firecrawl result keys: {dir(result)}")
-        print(f"🔍 Firecrawl json attribute: {getattr(result, 'json', 'Not found')}")
+        # Wait for the rate limit before taking a slot, so a slot is only held for the request itself.
+        rate_limiter.acquire()
+        with firecrawl_slots:
+            result = app.scrape(url, formats=formats, only_main_content=False, exclude_tags=EXCLUDED_TAGS, timeout=120000)
     except Exception as e:
         print(f"❌ Scrape failed: {e}. Retrying with minimal wait.")
         try:
-            result = app.scrape(url, formats=formats, actions=[{"type": "wait", "milliseconds": 5000}], only_main_content=False, timeout=120000)
-            print(f"🔍 Firecrawl retry result: {getattr(result, 'json', 'Not found')}")
+            rate_limiter.acquire()
+            with firecrawl_slots:
+                result = app.scrape(url, formats=formats, actions=[{"type": "wait", "milliseconds": 5000}], only_main_content=False, exclude_tags=EXCLUDED_TAGS, timeout=120000)
         except Exception as e2:
             print(f"❌ Scrape retry failed: {e2}.")
             return None
     
-    try:
-        if hasattr(result, 'json'):
-            data = result.json
-        else:
-            raise AttributeError("No 'json' attribute in result")
-    except (AttributeError, json.JSONDecodeError) as e:
-        print(f"❌ Failed to parse extracted JSON: {e}. Result attributes: {dir(result)}")
+    data = getattr(result, 'json', None)
+    if not isinstance(data, dict):
+        print("❌ Firecrawl returned no extracted JSON.")
         return None
     
     etf_name = data.get('name', 'Unknown')
@@ -140,7 +177,10 @@ Output strictly in JSON with no additional text:
         return None
     
     print(f"✅ Extracted {len(holdings)} holdings from table.")
-    return {"isin": etf_isin, "name": etf_name, "holdings": holdings[:10]}  # Limit to top 10 holdings
+    scrape_result = {"isin": etf_isin, "name": etf_name, "holdings": holdings[:10]}  # Limit to top 10 holdings
+    if CACHE_MODE == "enabled":
+        save_cached_result(url, prompt, scrape_result)
+    return scrape_result
 
 async def main():
     """Main function to orchestrate the scraping process."""
@@ -149,29 +189,45 @@ async def main():
         print("No ETF URLs collected, exiting.")
         return
 
-    final_json_output = {}
-    for i, url in enumerate(urls):
-        print(f"\n--- Processing ETF {i + 1}/{len(urls)} ---")
-        
-        scrape_result = scrape_etf_page(url)
-        if scrape_result and scrape_result.get("isin"):
-            final_json_output[scrape_result["isin"]] = scrape_result
-            print(f"📊 Processed {scrape_result['name']} ({len(scrape_result['holdings'])} holdings)")
-        else:
-            print(f"❌ Failed to process {url} or no data returned.")
-        
-        is_last_item = (i + 1) == len(urls)
-        if (i + 1) % BATCH_SIZE == 0 and not is_last_item:
-            print(f"\n✅ Batch of {BATCH_SIZE} complete. Waiting for {DELAY_BETWEEN_BATCHES_SECONDS} seconds...")
-            await asyncio.sleep(DELAY_BETWEEN_BATCHES_SECONDS)
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    # Resume: ETFs already streamed by an interrupted run are kept and not scraped again.
+    done_urls = load_done_urls(JSONL_FILENAME)
+    if done_urls:
+        print(f"♻️ Resuming: {len(done_urls)} ETFs already finished in a previous run.")
+    pending_urls = [url for url in urls if url not in done_urls]
+    # Sliding window: a new scrape starts as soon as any running one finishes, with no per-batch barrier.
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT_SCRAPES)
+
+    async def scrape_with_limit(url):
+        async with semaphore:
+            # The Firecrawl SDK is synchronous, so each scrape runs in its own worker thread;
+            # the shared token bucket keeps the combined request rate within the plan's limit.
+            try:
+                return url, await asyncio.to_thread(scrape_etf_page, url)
+            except Exception as e:
+                print(f"❌ Unexpected error while processing {url}: {e}")
+                return url, None
+
+    # Each result is appended as one JSON line the moment it arrives, so nothing accumulates in memory
+    # and a re-run after a crash picks up where this one stopped.
+    scraped_count = len(done_urls)
+    print(f"\n--- Processing {len(pending_urls)} ETFs, up to {MAX_CONCURRENT_SCRAPES} at a time ---")
+    with open(JSONL_FILENAME, "ab") as jsonl_file:
+        for finished in asyncio.as_completed([scrape_with_limit(url) for url in pending_urls]):
+            url, scrape_result = await finished
+            if scrape_result and scrape_result.get("isin") not in MISSING_ISIN_VALUES:
+                append_record(jsonl_file, url, scrape_result)
+                scraped_count += 1
+                print(f"📊 Processed {scrape_result['name']} ({len(scrape_result['holdings'])} holdings)")
+            else:
+                print(f"❌ Failed to process {url} or no data returned.")
 
-    if final_json_output:
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    if scraped_count:
         filename = f"dws_etf_data_{timestamp}.json"
-        with open(filename, "w", encoding="utf-8") as f:
-            json.dump(final_json_output, f, indent=2, ensure_ascii=False)
-        print(f"\n✅ Done! Scraped {len(final_json_output)} ETFs and saved to {filename}.")
+        etf_count = consolidate_stream(JSONL_FILENAME, filename)
+        print(f"\n✅ Done! Scraped {etf_count} ETFs and saved to {filename}.")
     else:
+        os.remove(JSONL_FILENAME)
         print("\n❌ No ETFs were scraped successfully.")
 
 if __name__ == "__main__":
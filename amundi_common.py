@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""
+Amundi URL Collection (shared)
+-------------------------------------------------
+Playwright helpers for collecting Amundi ETF product page URLs, shared by amundietf.py and Combined.py.
+The caller owns the browser; each collection runs in its own context so it can run next to other providers.
+"""
+import os
+from urllib.parse import urljoin
+from scraper_common import FIRST_N_HREFS_JS, block_heavy_resources, click_consent_buttons
+
+AMUNDI_URL = "https://www.amundietf.de/de/professionell/etf-products/search"
+AMUNDI_BASE_URL = "https://www.amundietf.de"
+ROW_SELECTOR = "div.FinderResultsSection__Datatable table tbody tr"
+LINK_SELECTOR = "div.FinderResultsSection__Datatable table tbody tr td a"
+CONSENT_STATE_FILE = ".amundi_consent_state.json"  # Saved consent cookies; delete to go through the pop-ups again
+
+CONSENT_STEPS = [
+    ('button[data-profile="INSTIT"]', "Professioneller Anleger"),
+    ('button:has-text("Akzeptieren und fortfahren")', "Akzeptieren und fortfahren"),
+    ('button:has-text("Alle annehmen")', "Alle annehmen"),
+]
+
+async def handle_consent_flow(page, timeout=10000):
+    """
+    Clicks the profile, acceptance, and cookie pop-ups in whichever order they appear.
+    Returns True only if at least one pop-up was clicked and none of the clicks failed.
+    """
+    print("🔎 Handling Amundi consent process...")
+    # The dialog closing is the signal a click took effect; networkidle would also wait out the trackers.
+    consented = await click_consent_buttons(page, CONSENT_STEPS, timeout=timeout, hidden_timeout=5000)
+    print("✅ Amundi consent flow complete.")
+    return consented
+
+async def get_etf_urls(browser, limit):
+    """Navigate the Amundi ETF search page in a fresh context of the shared browser and collect up to `limit` product page URLs."""
+    etf_urls = []
+    print("🚀 Opening browser context for Amundi URLs...")
+    # Cookies and localStorage from an earlier run already hold the consent choices, so the pop-ups
+    # normally do not appear and the consent check only needs a short timeout.
+    has_consent_state = os.path.exists(CONSENT_STATE_FILE)
+    context = await browser.new_context(storage_state=CONSENT_STATE_FILE if has_consent_state else None)
+    await context.route("**/*", block_heavy_resources)
+    page = await context.new_page()
+    try:
+        await page.goto(AMUNDI_URL, timeout=90000)
+        consented = await handle_consent_flow(page, timeout=2000 if has_consent_state else 10000)
+        print(f"⏳ Waiting for Amundi ETF list to load to collect the top {limit} URLs...")
+        await page.wait_for_selector(ROW_SELECTOR, timeout=60000)
+        # Saved only after the pop-ups were actually answered, so a run where they timed out does not
+        # leave a file that makes later runs skip ahead with the short timeout.
+        if consented:
+            await context.storage_state(path=CONSENT_STATE_FILE)
+        hrefs = await page.eval_on_selector_all(LINK_SELECTOR, FIRST_N_HREFS_JS, limit)
+        etf_urls = [urljoin(AMUNDI_BASE_URL, href) for href in hrefs if href]
+    finally:
+        await context.close()
+    print(f"✅ Collected {len(etf_urls)} Amundi ETF URLs.")
+    return etf_urls
@@ -6,82 +6,36 @@ Uses Playwright for collecting ETF URLs (classic method), and Firecrawl to extra
 Extracts data directly from the page's table (e.g., 'table.top-holdings') without using CSV downloads.
 
 Requirements:
-- pip install playwright firecrawl-py
+- pip install playwright firecrawl-py orjson
 - playwright install
 - Set FIRECRAWL_API_KEY as an environment variable (sign up at firecrawl.dev for a key)
 
 WARNING: Do not hardcode API keys in scripts. Use environment variables for security.
 """
 import asyncio
-import json
 import os
 from datetime import datetime
 from playwright.async_api import async_playwright
-from urllib.parse import urljoin
+from amundi_common import get_etf_urls
+from scraper_common import (
+    EXCLUDED_TAGS, MISSING_ISIN_VALUES, append_record, consolidate_stream, load_cached_result, load_done_urls,
+    save_cached_result,
+)
 
 # --- CONFIGURATION ---
 TOTAL_ETFS_TO_SCRAPE = 1  # Set back to 5
-BATCH_SIZE = 5
-DELAY_BETWEEN_BATCHES_SECONDS = 25
+MAX_PARALLEL_SCRAPES = 5  # ETF pages scraped at the same time (match your Firecrawl plan's concurrency limit)
+JSONL_FILENAME = "amundi_etf_data_partial.jsonl"  # Results are streamed here while the run is in progress
 # --- END CONFIGURATION ---
 
-AMUNDI_URL = "https://www.amundietf.de/de/professionell/etf-products/search"
+# Lighter headless Chromium for containers: no /dev/shm size limit issues and no GPU process.
+BROWSER_ARGS = ["--disable-dev-shm-usage", "--disable-gpu"]
 
-from firecrawl import FirecrawlApp
-app = FirecrawlApp(api_key="FIRECRAWL_API_KEY")
+from firecrawl import AsyncFirecrawl
+# One async client for the whole run: its pooled HTTP connections are reused by every scrape.
+app = AsyncFirecrawl(api_key="FIRECRAWL_API_KEY")
 
-async def handle_consent_flow(page):
-    """Handles the precise 3-step consent process sequentially."""
-    print("🔎 Handling sequential consent process...")
-    try:
-        profile_selector = 'button[data-profile="INSTIT"]'
-        print("   - Step 1: Waiting for profile selection pop-up...")
-        await page.locator(profile_selector).click(timeout=10000)
-        print("   - ✅ Clicked 'Professioneller Anleger'.")
-        await page.wait_for_load_state('networkidle', timeout=15000)
-    except:
-        print("   - ✓ Profile selection pop-up not found (Step 1 skipped).")
-    try:
-        accept_selector = 'button:has-text("Akzeptieren und fortfahren")'
-        print("   - Step 2: Waiting for final acceptance pop-up...")
-        await page.locator(accept_selector).click(timeout=10000)
-        print("   - ✅ Clicked 'Akzeptieren und fortfahren'.")
-        await page.wait_for_load_state('networkidle', timeout=15000)
-    except:
-        print("   - ✓ Final acceptance pop-up not found (Step 2 skipped).")
-    try:
-        cookie_selector = 'button:has-text("Alle annehmen")'
-        print("   - Step 3: Waiting for cookie banner...")
-        await page.locator(cookie_selector).click(timeout=10000)
-        print("   - ✅ Clicked 'Alle annehmen'.")
-        await page.wait_for_load_state('networkidle', timeout=15000)
-    except:
-        print("   - ✓ Cookie banner not found (Step 3 skipped).")
-    print("✅ Consent flow complete.")
-
-async def get_etf_urls():
-    """Navigate Amundi ETF search page and collect product page URLs."""
-    etf_urls = []
-    print("🚀 Launching browser to collect ETF URLs...")
-    async with async_playwright() as p:
-        browser = await p.chromium.launch(headless=False, slow_mo=100)
-        page = await browser.new_page()
-        await page.goto(AMUNDI_URL, timeout=90000)
-        await handle_consent_flow(page)
-        print(f"⏳ Waiting for ETF list to load...")
-        await page.wait_for_selector("div.FinderResultsSection__Datatable table tbody tr", timeout=60000)
-        print("✅ ETF table loaded.")
-        links = await page.locator("div.FinderResultsSection__Datatable table tbody tr td a").all()
-        for link in links[:TOTAL_ETFS_TO_SCRAPE]:
-            href = await link.get_attribute("href")
-            if href:
-                full_url = urljoin("https://www.amundietf.de", href)
-                etf_urls.append(full_url)
-        await browser.close()
-    print(f"✅ Collected {len(etf_urls)} ETF URLs.")
-    return etf_urls
-
-def scrape_etf_page(url):
+async def scrape_etf_page(url):
     """Use Firecrawl to extract name, ISIN, and top 10 holdings from the ETF page's HTML table."""
     print(f"📄 Processing {url}...")
     prompt = """
@@ -103,28 +57,25 @@ For holdings:
 Output strictly in JSON with no additional text:
 {"name": "string", "isin": "string", "holdings": [{"name": "string", "sector": "string", "securityType": "string", "weight": float, "isin": "string"}] or []}
 """
+    cached_result = await asyncio.to_thread(load_cached_result, url, prompt)
+    if cached_result:
+        print(f"💾 Using cached result for {url}")
+        return cached_result
+
     formats = [{"type": "json", "prompt": prompt}]
     try:
-        result = app.scrape(url, formats=formats, only_main_content=False, timeout=120000)
-        print(f"🔍 Firecrawl result keys: {dir(result)}")
-        print(f"🔍 Firecrawl json attribute: {getattr(result, 'json', 'Not found')}")
+        result = await app.scrape(url, formats=formats, only_main_content=False, exclude_tags=EXCLUDED_TAGS, timeout=120000)
     except Exception as e:
         print(f"❌ Scrape failed: {e}. Retrying with minimal wait.")
         try:
-            result = app.scrape(url, formats=formats, actions=[{"type": "wait", "milliseconds": 5000}], only_main_content=False, timeout=120000)
-            print(f"🔍 Firecrawl retry result: {getattr(result, 'json', 'Not found')}")
+            result = await app.scrape(url, formats=formats, actions=[{"type": "wait", "milliseconds": 5000}], only_main_content=False, exclude_tags=EXCLUDED_TAGS, timeout=120000)
         except Exception as e2:
             print(f"❌ Scrape retry failed: {e2}.")
             return None
     
-    # Access json as attribute (Firecrawl SDK returns ScrapeResult object)
-    try:
-        if hasattr(result, 'json'):
-            data = result.json
-        else:
-            raise AttributeError("No 'json' attribute in result")
-    except (AttributeError, json.JSONDecodeError) as e:
-        print(f"❌ Failed to parse extracted JSON: {e}. Result attributes: {dir(result)}")
+    data = getattr(result, 'json', None)
+    if not isinstance(data, dict):
+        print("❌ Firecrawl returned no extracted JSON.")
         return None
     
     etf_name = data.get('name', 'Unknown')
@@ -136,38 +87,63 @@ Output strictly in JSON with no additional text:
         return None
     
     print(f"✅ Extracted {len(holdings)} holdings from table.")
-    return {"isin": etf_isin, "name": etf_name, "holdings": holdings[:10]}  # Limit to top 10 holdings
+    scrape_result = {"isin": etf_isin, "name": etf_name, "holdings": holdings[:10]}  # Limit to top 10 holdings
+    await asyncio.to_thread(save_cached_result, url, prompt, scrape_result)
+    return scrape_result
 
 async def main():
     """Main function to orchestrate the scraping process."""
-    urls = await get_etf_urls()
+    # One timestamp per run, taken at start-up, so every file of the run shares the same suffix.
+    run_timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    print("🚀 Launching browser...")
+    async with async_playwright() as p:
+        browser = await p.chromium.launch(
+            headless=True,
+            slow_mo=int(os.environ.get("PW_SLOWMO", "0")),
+            args=BROWSER_ARGS,
+        )
+        try:
+            urls = await get_etf_urls(browser, TOTAL_ETFS_TO_SCRAPE)
+        finally:
+            await browser.close()
     if not urls:
         print("No ETFs found, exiting.")
         return
 
-    final_json_output = {}
-    for i, url in enumerate(urls):
-        print(f"\n--- Processing ETF {i + 1}/{len(urls)} ---")
-        
-        scrape_result = scrape_etf_page(url)
-        if scrape_result and scrape_result.get("isin"):
-            final_json_output[scrape_result["isin"]] = scrape_result
+    # Resume: ETFs already streamed by an interrupted run are kept and not scraped again.
+    done_urls = load_done_urls(JSONL_FILENAME)
+    if done_urls:
+        print(f"♻️ Resuming: {len(done_urls)} ETFs already finished in a previous run.")
+    pending_urls = [url for url in urls if url not in done_urls]
+
+    semaphore = asyncio.Semaphore(MAX_PARALLEL_SCRAPES)
+    scraped_count = len(done_urls)
+
+    async def worker(url, jsonl_file):
+        nonlocal scraped_count
+        async with semaphore:
+            try:
+                scrape_result = await scrape_etf_page(url)
+            except Exception as e:
+                print(f"❌ Unexpected error while processing {url}: {e}")
+                return
+        if scrape_result and scrape_result.get("isin") not in MISSING_ISIN_VALUES:
+            append_record(jsonl_file, url, scrape_result)
+            scraped_count += 1
             print(f"📊 Processed {scrape_result['name']} ({len(scrape_result['holdings'])} holdings)")
         else:
             print(f"❌ Failed to process {url} or no data returned.")
-        
-        is_last_item = (i + 1) == len(urls)
-        if (i + 1) % BATCH_SIZE == 0 and not is_last_item:
-            print(f"\n✅ Batch of {BATCH_SIZE} complete. Waiting for {DELAY_BETWEEN_BATCHES_SECONDS} seconds...")
-            await asyncio.sleep(DELAY_BETWEEN_BATCHES_SECONDS)
-
-    if final_json_output:
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"amundi_etf_data_{timestamp}.json"
-        with open(filename, "w", encoding="utf-8") as f:
-            json.dump(final_json_output, f, indent=2, ensure_ascii=False)
-        print(f"\n✅ Done! Scraped {len(final_json_output)} ETFs and saved to {filename}.")
+
+    print(f"\n--- Processing {len(pending_urls)} ETFs, up to {MAX_PARALLEL_SCRAPES} at a time ---")
+    with open(JSONL_FILENAME, "ab") as jsonl_file:
+        await asyncio.gather(*(worker(url, jsonl_file) for url in pending_urls))
+
+    if scraped_count:
+        filename = f"amundi_etf_data_{run_timestamp}.json"
+        etf_count = consolidate_stream(JSONL_FILENAME, filename)
+        print(f"\n✅ Done! Scraped {etf_count} ETFs and saved to {filename}.")
     else:
+        os.remove(JSONL_FILENAME)
         print("\n❌ No ETFs were scraped successfully.")
 
 if __name__ == "__main__":
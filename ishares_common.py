@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+"""
+iShares URL Collection (shared)
+-------------------------------------------------
+Playwright helpers for collecting iShares ETF product page URLs, shared by Ishare.py and Combined.py.
+The caller owns the browser; each collection runs in its own context so it can run next to other providers.
+"""
+import asyncio
+from scraper_common import FIRST_N_HREFS_JS, block_heavy_resources
+
+ISHARES_URL = "https://www.ishares.com/de/privatanleger/de/produkte/etf-investments#/?productView=all&pageNumber=1&sortColumn=totalFundSizeInMillions&sortDirection=desc&dataView=keyFacts&keyFacts=all"
+PRODUCT_LINK_SELECTOR = "a.link-to-product-page"
+PRODUCT_URL_TEMPLATE = "https://www.ishares.com{path}?switchLocale=y&siteEntryPassthrough=true"
+
+async def get_etf_urls(browser, limit):
+    """Navigate the iShares ETF list in a fresh context of the shared browser and collect up to `limit` product page URLs."""
+    etf_urls = []
+    print("🚀 Opening browser context for iShares URLs...")
+    context = await browser.new_context()
+    await context.route("**/*", block_heavy_resources)
+    page = await context.new_page()
+    try:
+        # The ETF list is awaited by selector below, so there is no need to wait for the full "load" event.
+        await page.goto(ISHARES_URL, timeout=90000, wait_until="domcontentloaded")
+
+        # Both pop-ups are independent, so their clicks run concurrently; Playwright keeps retrying the
+        # Weiter click while the cookie overlay still covers it.
+        cookie_click, weiter_click = await asyncio.gather(
+            page.locator('#onetrust-accept-btn-handler').click(timeout=10000),
+            page.locator('a[data-link-event="Accept t&c: individual"]:has-text("Weiter")').click(timeout=10000),
+            return_exceptions=True,
+        )
+        print("⚠️ No cookie banner found." if isinstance(cookie_click, Exception) else "✅ Cookies accepted")
+        print("⚠️ No Weiter link found." if isinstance(weiter_click, Exception) else "✅ Clicked Weiter")
+
+        print(f"⏳ Waiting for iShares ETF list to load to collect the top {limit} URLs...")
+        await page.wait_for_selector(PRODUCT_LINK_SELECTOR, timeout=60000)
+        hrefs = await page.eval_on_selector_all(PRODUCT_LINK_SELECTOR, FIRST_N_HREFS_JS, limit)
+        etf_urls = [PRODUCT_URL_TEMPLATE.format(path=href.split('?', 1)[0]) for href in hrefs if href]
+    finally:
+        await context.close()
+    print(f"✅ Collected {len(etf_urls)} iShares ETF URLs.")
+    return etf_urls
@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+"""
+Scraper Helpers (shared)
+-------------------------------------------------
+Provider-independent helpers shared by every scraper and the provider URL collectors:
+Playwright resource blocking, Firecrawl request settings and rate limiting, and the on-disk result cache.
+"""
+import hashlib
+import orjson
+import os
+import threading
+import time
+from playwright.async_api import TimeoutError as PlaywrightTimeoutError
+
+# --- PLAYWRIGHT ---
+# Reads the first n hrefs in one round-trip instead of one get_attribute call per link.
+FIRST_N_HREFS_JS = "(els, n) => els.slice(0, n).map(e => e.getAttribute('href'))"
+
+# URL collection only reads link hrefs, so rendering assets and trackers are never downloaded.
+# Documents, scripts, and XHR/fetch still load because the ETF tables are built from them.
+BLOCKED_RESOURCE_TYPES = {"image", "font", "media", "stylesheet", "websocket"}
+BLOCKED_URL_KEYWORDS = ("doubleclick", "google-analytics", "googletagmanager", "adobedtm", "facebook.net", "hotjar")
+
+async def block_heavy_resources(route):
+    """Route handler that aborts requests for images, fonts, media, stylesheets, websockets, and known trackers."""
+    request = route.request
+    if request.resource_type in BLOCKED_RESOURCE_TYPES or any(keyword in request.url for keyword in BLOCKED_URL_KEYWORDS):
+        await route.abort()
+    else:
+        await route.continue_()
+
+async def click_consent_buttons(page, buttons, timeout=5000, click_timeout=10000, hidden_timeout=None):
+    """
+    Clicks (selector, label) consent buttons in whatever order they appear, racing all pending selectors with Locator.or_.
+    With hidden_timeout, each click also waits for its button to go away, the signal that the click took effect.
+    Returns True only if at least one button was clicked and none of the clicks failed.
+    """
+    pending = list(buttons)
+    clicked = failed = False
+    while pending:
+        # The wait, the check, and the click all target the first *visible* match, so a hidden
+        # duplicate earlier in the DOM cannot make the wait succeed while the check keeps failing.
+        any_button = page.locator(pending[0][0])
+        for selector, _ in pending[1:]:
+            any_button = any_button.or_(page.locator(selector))
+        try:
+            await any_button.filter(visible=True).first.wait_for(timeout=timeout)
+        except PlaywrightTimeoutError:
+            break
+        for step in pending:
+            selector, label = step
+            button = page.locator(selector).filter(visible=True).first
+            if await button.is_visible():
+                try:
+                    await button.click(timeout=click_timeout)
+                    print(f"   - ✅ Clicked '{label}'.")
+                    if hidden_timeout:
+                        await button.wait_for(state='hidden', timeout=hidden_timeout)
+                    clicked = True
+                except PlaywrightTimeoutError:
+                    print(f"   - ⚠️ Could not finish '{label}'.")
+                    failed = True
+                pending.remove(step)
+                break
+        else:
+            break  # The button vanished between the wait and the check; stop rather than wait on it again.
+    for _, label in pending:
+        print(f"   - ✓ '{label}' pop-up not found (skipped).")
+    return clicked and not failed
+
+# --- FIRECRAWL ---
+# Page elements that never hold fund data; stripping them keeps the content sent to the extraction LLM small.
+EXCLUDED_TAGS = ["script", "style", "noscript", "svg", "img", "iframe", "nav", "footer"]
+
+# Firecrawl's free plan allows 10 /scrape requests per minute; raise this to your plan's limit.
+FIRECRAWL_REQUESTS_PER_MINUTE = 10
+FIRECRAWL_BURST = 1  # Requests that may go out back-to-back before the rate limit applies
+
+# Placeholders the extraction returns when a page has no ISIN; such results cannot be keyed and are rejected.
+MISSING_ISIN_VALUES = (None, "", "Unknown", "N/A")
+
+def is_complete_result(scrape_result):
+    """True if a scrape result has a real ISIN and at least one holding, i.e. is worth keeping and caching."""
+    return bool(scrape_result) and scrape_result.get("isin") not in MISSING_ISIN_VALUES and bool(scrape_result.get("holdings"))
+
+class TokenBucket:
+    """Thread-safe token bucket: acquire() blocks only as long as needed to stay under the rate limit."""
+
+    def __init__(self, rate_per_minute, capacity):
+        self.rate_per_second = rate_per_minute / 60
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate_per_second)
+            self.updated_at = now
+            wait_seconds = (1 - self.tokens) / self.rate_per_second if self.tokens < 1 else 0
+            # Reserve the token now so concurrent callers queue up behind this one.
+            self.tokens -= 1
+        if wait_seconds > 0:
+            print(f"⏳ Rate limit: waiting {wait_seconds:.1f} seconds before the next Firecrawl request...")
+            time.sleep(wait_seconds)
+
+# --- RESULT CACHE ---
+CACHE_DIR = "cache"  # Firecrawl results are cached here, keyed by URL + prompt; delete it to scrape fresh
+CACHE_MAX_AGE_HOURS = 24  # Cached results older than this are scraped again (holdings change over time)
+
+def get_cache_path(url, prompt):
+    """Returns the cache file for a URL/prompt pair."""
+    key = hashlib.sha256((url + prompt).encode("utf-8")).hexdigest()
+    return os.path.join(CACHE_DIR, f"{key}.json")
+
+def load_cached_result(url, prompt, max_age_hours=CACHE_MAX_AGE_HOURS):
+    """Returns the cached scrape result for a URL/prompt pair, or None on a cache miss or an entry older than max_age_hours (None: never expires)."""
+    path = get_cache_path(url, prompt)
+    try:
+        if max_age_hours is not None and time.time() - os.path.getmtime(path) > max_age_hours * 3600:
+            return None
+        with open(path, "rb") as f:
+            return orjson.loads(f.read())
+    except FileNotFoundError:
+        return None
+    except (OSError, orjson.JSONDecodeError) as e:
+        print(f"⚠️ Ignoring unreadable cache file {path}: {e}")
+        return None
+
+def save_cached_result(url, prompt, scrape_result):
+    """Stores a complete scrape result so re-runs can skip the Firecrawl call; incomplete results are never cached."""
+    if not is_complete_result(scrape_result):
+        return
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    with open(get_cache_path(url, prompt), "wb") as f:
+        f.write(orjson.dumps(scrape_result))
+
+# --- RESULT STREAM ---
+# Scrapers append each finished ETF to a JSON-lines stream file the moment it arrives, so nothing
+# accumulates in memory, and consolidate the stream into the usual ISIN-keyed JSON file at the end.
+
+def append_record(stream_file, url, record):
+    """Appends one scraped ETF to an open binary stream file as a {"url", "data"} line, flushed right away."""
+    stream_file.write(orjson.dumps({"url": url, "data": record}, option=orjson.OPT_APPEND_NEWLINE))
+    stream_file.flush()
+
+def read_stream(jsonl_path):
+    """Yields the (url, record) pairs of a stream file, skipping any line cut short by a crash."""
+    with open(jsonl_path, "rb") as f:
+        for line in f:
+            try:
+                entry = orjson.loads(line)
+                url, record = entry["url"], entry["data"]
+            except (orjson.JSONDecodeError, KeyError, TypeError):
+                continue
+            yield url, record
+
+def repair_stream(jsonl_path):
+    """
+    Rewrites a stream file without lines cut short by a crash, before a resumed run appends to it.
+    Otherwise the next record would be appended onto the partial line and both would be lost.
+    The rewrite goes through a temporary file, so interrupting it never loses the records already streamed.
+    """
+    with open(jsonl_path, "rb") as f:
+        lines = f.readlines()
+    valid_lines = []
+    for line in lines:
+        try:
+            orjson.loads(line)
+        except orjson.JSONDecodeError:
+            continue
+        valid_lines.append(line if line.endswith(b"\n") else line + b"\n")
+    if valid_lines != lines:
+        with open(f"{jsonl_path}.tmp", "wb") as f:
+            f.writelines(valid_lines)
+        os.replace(f"{jsonl_path}.tmp", jsonl_path)
+        print(f"🧹 Dropped {len(lines) - len(valid_lines)} incomplete line(s) from {jsonl_path}.")
+
+def load_done_urls(jsonl_path):
+    """Returns the URLs already written to a stream file by an interrupted run, dropping a line cut short by a crash."""
+    if not os.path.exists(jsonl_path):
+        return set()
+    repair_stream(jsonl_path)
+    return {url for url, _ in read_stream(jsonl_path)}
+
+def consolidate_stream(jsonl_path, json_path):
+    """
+    Writes a stream file's records to an ISIN-keyed JSON file in one pass and removes the stream.
+    The JSON file is written to a temporary file first, so an interrupted write never leaves a truncated output file.
+    Returns the number of ETFs written.
+    """
+    records = {record["isin"]: record for _, record in read_stream(jsonl_path)}
+    with open(f"{json_path}.tmp", "wb") as f:
+        f.write(orjson.dumps(records, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS))
+    os.replace(f"{json_path}.tmp", json_path)
+    os.remove(jsonl_path)
+    return len(records)
@@ -6,70 +6,33 @@ Uses Playwright for collecting ETF URLs, and Firecrawl to extract name, ISIN, an
 Extracts data directly from the page's table without using CSV downloads.
 
 Requirements:
-- pip install playwright firecrawl-py
+- pip install playwright firecrawl-py orjson
 - playwright install
 - Set FIRECRAWL_API_KEY as an environment variable (sign up at firecrawl.dev for a key)
 
 WARNING: Do not hardcode API keys in scripts. Use environment variables for security.
 """
 import asyncio
-import json
 import os
 from datetime import datetime
 from playwright.async_api import async_playwright
-from urllib.parse import urljoin
+from scraper_common import (
+    EXCLUDED_TAGS, FIRECRAWL_BURST, FIRECRAWL_REQUESTS_PER_MINUTE, MISSING_ISIN_VALUES, TokenBucket,
+    append_record, consolidate_stream, load_cached_result, load_done_urls, save_cached_result,
+)
+from vanguard_common import get_etf_urls
 
 # --- CONFIGURATION ---
 TOTAL_ETFS_TO_SCRAPE = 2  # Set back to 5
-BATCH_SIZE = 1
-DELAY_BETWEEN_BATCHES_SECONDS = 61
+MAX_PARALLEL_SCRAPES = 6  # ETF pages scraped at the same time (match your Firecrawl plan's concurrency limit)
+JSONL_FILENAME = "vanguard_etf_data_partial.jsonl"  # Results are streamed here while the run is in progress
 # --- END CONFIGURATION ---
 
-VANGUARD_URL = "https://investor.vanguard.com/investment-products/list/etfs"
-
 from firecrawl import FirecrawlApp
 app = FirecrawlApp(api_key="FIRECRAWL_API_KEY")
 
-async def handle_consent_flow(page):
-    """Handle Vanguard-specific consent process."""
-    print("🔎 Handling consent process...")
-    try:
-        cookie_selector = 'button#onetrust-accept-btn-handler'
-        print("   - Waiting for cookie banner...")
-        await page.locator(cookie_selector).click(timeout=7000)
-        print("   - ✅ Cookies accepted.")
-        await page.wait_for_selector('.onetrust-pc-dark-filter', state='detached', timeout=5000)
-    except:
-        print("   - ✓ No cookie banner found.")
-    print("✅ Consent flow complete.")
-
-async def get_etf_urls():
-    """Navigate Vanguard ETF list page and collect product page URLs."""
-    etf_urls = []
-    print("🚀 Launching browser to collect ETF URLs...")
-    async with async_playwright() as p:
-        browser = await p.chromium.launch(headless=False, slow_mo=100)
-        page = await browser.new_page()
-        await page.goto(VANGUARD_URL, timeout=90000, wait_until="domcontentloaded")
-        await handle_consent_flow(page)
-        print(f"⏳ Waiting for ETF list to load...")
-        try:
-            await page.wait_for_selector("tr[data-rpa-tag-id]", timeout=60000)
-            print("✅ ETF table loaded.")
-            while await page.locator('button:has-text("Show more")').is_visible():
-                await page.locator('button:has-text("Show more")').click()
-                await page.wait_for_load_state('networkidle', timeout=15000)
-            links = await page.locator("tr[data-rpa-tag-id] a[data-rpa-tag-id='longName']").all()
-            for link in links[:TOTAL_ETFS_TO_SCRAPE]:
-                href = await link.get_attribute("href")
-                if href:
-                    full_url = urljoin(VANGUARD_URL, href)
-                    etf_urls.append(full_url)
-        except Exception as e:
-            print(f"❌ Failed to load ETF list: {e}")
-        await browser.close()
-    print(f"✅ Collected {len(etf_urls)} ETF URLs.")
-    return etf_urls
+# Paces Firecrawl requests at the plan's rate limit (see scraper_common.py) instead of a fixed pause per ETF.
+rate_limiter = TokenBucket(FIRECRAWL_REQUESTS_PER_MINUTE, FIRECRAWL_BURST)
 
 def scrape_etf_page(url):
     """Use Firecrawl to extract name, ISIN, and top 10 holdings from the ETF page's HTML table."""
@@ -93,27 +56,27 @@ For holdings:
 Output strictly in JSON with no additional text:
 {"name": "string", "isin": "string", "holdings": [{"name": "string", "sector": "string", "securityType": "string", "weight": float, "isin": "string"}] or []}
 """
+    cached_result = load_cached_result(url, prompt)
+    if cached_result:
+        print(f"💾 Using cached result for {url}")
+        return cached_result
+
     formats = [{"type": "json", "prompt": prompt}]
     try:
-        result = app.scrape(url, formats=formats, only_main_content=False, timeout=120000)
-        print(f"🔍 Firecrawl result keys: {dir(result)}")
-        print(f"🔍 Firecrawl json attribute: {getattr(result, 'json', 'Not found')}")
+        rate_limiter.acquire()
+        result = app.scrape(url, formats=formats, only_main_content=False, exclude_tags=EXCLUDED_TAGS, timeout=120000)
     except Exception as e:
         print(f"❌ Scrape failed: {e}. Retrying with minimal wait.")
         try:
-            result = app.scrape(url, formats=formats, actions=[{"type": "wait", "milliseconds": 5000}], only_main_content=False, timeout=120000)
-            print(f"🔍 Firecrawl retry result: {getattr(result, 'json', 'Not found')}")
+            rate_limiter.acquire()
+            result = app.scrape(url, formats=formats, actions=[{"type": "wait", "milliseconds": 5000}], only_main_content=False, exclude_tags=EXCLUDED_TAGS, timeout=120000)
         except Exception as e2:
             print(f"❌ Scrape retry failed: {e2}.")
             return None
     
-    try:
-        if hasattr(result, 'json'):
-            data = result.json
-        else:
-            raise AttributeError("No 'json' attribute in result")
-    except (AttributeError, json.JSONDecodeError) as e:
-        print(f"❌ Failed to parse extracted JSON: {e}. Result attributes: {dir(result)}")
+    data = getattr(result, 'json', None)
+    if not isinstance(data, dict):
+        print("❌ Firecrawl returned no extracted JSON.")
         return None
     
     etf_name = data.get('name', 'Unknown')
@@ -125,38 +88,64 @@ Output strictly in JSON with no additional text:
         return None
     
     print(f"✅ Extracted {len(holdings)} holdings from table.")
-    return {"isin": etf_isin, "name": etf_name, "holdings": holdings[:10]}  # Limit to top 10 holdings
+    scrape_result = {"isin": etf_isin, "name": etf_name, "holdings": holdings[:10]}  # Limit to top 10 holdings
+    save_cached_result(url, prompt, scrape_result)
+    return scrape_result
 
 async def main():
     """Main function to orchestrate the scraping process."""
-    urls = await get_etf_urls()
+    print("🚀 Launching browser...")
+    async with async_playwright() as p:
+        browser = await p.chromium.launch(headless=True, slow_mo=int(os.environ.get("PW_SLOWMO", "0")))
+        try:
+            urls = await get_etf_urls(browser, TOTAL_ETFS_TO_SCRAPE)
+        except Exception as e:
+            print(f"❌ Failed to load ETF list: {e}")
+            urls = []
+        finally:
+            await browser.close()
     if not urls:
         print("No ETFs found, exiting.")
         return
 
-    final_json_output = {}
-    for i, url in enumerate(urls):
-        print(f"\n--- Processing ETF {i + 1}/{len(urls)} ---")
-        
-        scrape_result = scrape_etf_page(url)
-        if scrape_result and scrape_result.get("isin"):
-            final_json_output[scrape_result["isin"]] = scrape_result
-            print(f"📊 Processed {scrape_result['name']} ({len(scrape_result['holdings'])} holdings)")
-        else:
-            print(f"❌ Failed to process {url} or no data returned.")
-        
-        is_last_item = (i + 1) == len(urls)
-        if (i + 1) % BATCH_SIZE == 0 and not is_last_item:
-            print(f"\n✅ Batch of {BATCH_SIZE} complete. Waiting for {DELAY_BETWEEN_BATCHES_SECONDS} seconds...")
-            await asyncio.sleep(DELAY_BETWEEN_BATCHES_SECONDS)
-
-    if final_json_output:
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    # Resume: ETFs already streamed by an interrupted run are kept and not scraped again.
+    done_urls = load_done_urls(JSONL_FILENAME)
+    if done_urls:
+        print(f"♻️ Resuming: {len(done_urls)} ETFs already finished in a previous run.")
+    pending_urls = [url for url in urls if url not in done_urls]
+    semaphore = asyncio.Semaphore(MAX_PARALLEL_SCRAPES)
+
+    async def worker(url):
+        async with semaphore:
+            # The Firecrawl SDK is synchronous, so each scrape runs in its own worker thread.
+            try:
+                return url, await asyncio.to_thread(scrape_etf_page, url)
+            except Exception as e:
+                print(f"❌ Unexpected error while processing {url}: {e}")
+                return url, None
+
+    # Each result is appended as one JSON line the moment it arrives, so nothing accumulates in memory
+    # and a re-run after a crash picks up where this one stopped. The token bucket paces the Firecrawl requests,
+    # so there is no fixed pause between batches.
+    scraped_count = len(done_urls)
+    print(f"\n--- Processing {len(pending_urls)} ETFs, up to {MAX_PARALLEL_SCRAPES} at a time ---")
+    with open(JSONL_FILENAME, "ab") as jsonl_file:
+        for finished in asyncio.as_completed([worker(url) for url in pending_urls]):
+            url, scrape_result = await finished
+            if scrape_result and scrape_result.get("isin") not in MISSING_ISIN_VALUES:
+                append_record(jsonl_file, url, scrape_result)
+                scraped_count += 1
+                print(f"📊 Processed {scrape_result['name']} ({len(scrape_result['holdings'])} holdings)")
+            else:
+                print(f"❌ Failed to process {url} or no data returned.")
+
+    if scraped_count:
         filename = f"vanguard_etf_data_{timestamp}.json"
-        with open(filename, "w", encoding="utf-8") as f:
-            json.dump(final_json_output, f, indent=2, ensure_ascii=False)
-        print(f"\n✅ Done! Scraped {len(final_json_output)} ETFs and saved to {filename}.")
+        etf_count = consolidate_stream(JSONL_FILENAME, filename)
+        print(f"\n✅ Done! Scraped {etf_count} ETFs and saved to {filename}.")
     else:
+        os.remove(JSONL_FILENAME)
         print("\n❌ No ETFs were scraped successfully.")
 
 if __name__ == "__main__":
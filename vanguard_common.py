@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Vanguard URL Collection (shared)
+-------------------------------------------------
+Playwright helpers for collecting Vanguard ETF product page URLs, shared by vanguard.py and Combined.py.
+The caller owns the browser; each collection runs in its own context so it can run next to other providers.
+"""
+import os
+from playwright.async_api import TimeoutError as PlaywrightTimeoutError
+from urllib.parse import urljoin
+from scraper_common import FIRST_N_HREFS_JS, block_heavy_resources
+
+VANGUARD_URL = "https://investor.vanguard.com/investment-products/list/etfs"
+NAVIGATION_TIMEOUT_MS = 30000  # Page loads finish well within this once heavy resources are blocked
+COOKIE_BUTTON = 'button#onetrust-accept-btn-handler'
+COOKIE_OVERLAY = '.onetrust-pc-dark-filter'
+ROW_SELECTOR = "tr[data-rpa-tag-id]"
+LINK_SELECTOR = "tr[data-rpa-tag-id] a[data-rpa-tag-id='longName']"
+SHOW_MORE_SELECTOR = 'button:has-text("Show more")'
+CONSENT_STATE_FILE = ".vanguard_consent_state.json"  # Saved consent cookies; delete to go through the banner again
+CONSENT_COOKIE = "OptanonAlertBoxClosed"  # Set by OneTrust only once the cookie banner has been answered
+# True once "Show more" has appended rows; waited on instead of networkidle, which Vanguard's trackers keep busy.
+ROWS_GREW_JS = "([selector, n]) => document.querySelectorAll(selector).length > n"
+
+async def accept_cookie_banner(page, timeout):
+    """Clicks the cookie banner's accept button and waits for its overlay to go away."""
+    try:
+        await page.locator(COOKIE_BUTTON).click(timeout=timeout)
+        print("   - ✅ Cookies accepted.")
+        await page.wait_for_selector(COOKIE_OVERLAY, state='detached', timeout=5000)
+    except PlaywrightTimeoutError:
+        print("   - ⚠️ Could not accept the cookie banner.")
+
+async def handle_consent_flow(page, timeout=7000):
+    """Handle Vanguard-specific consent process."""
+    print("🔎 Handling Vanguard consent process...")
+    cookie_button = page.locator(COOKIE_BUTTON)
+    try:
+        print("   - Waiting for cookie banner...")
+        # Stop waiting as soon as either the banner or the ETF table shows up, so a page without
+        # a banner does not cost the full timeout. A banner that shows up later is handled before "Show more".
+        await cookie_button.or_(page.locator(ROW_SELECTOR)).first.wait_for(timeout=timeout)
+    except PlaywrightTimeoutError:
+        pass
+    if await cookie_button.is_visible():
+        await accept_cookie_banner(page, timeout)
+    else:
+        print("   - ✓ No cookie banner found.")
+    print("✅ Vanguard consent flow complete.")
+
+async def save_consent_state(context):
+    """Saves the context's cookies for later runs, but only once consent was actually given; a stale file is removed."""
+    if any(cookie["name"] == CONSENT_COOKIE for cookie in await context.cookies()):
+        await context.storage_state(path=CONSENT_STATE_FILE)
+    elif os.path.exists(CONSENT_STATE_FILE):
+        os.remove(CONSENT_STATE_FILE)
+
+async def get_etf_urls(browser, limit):
+    """Navigate the Vanguard ETF list in a fresh context of the shared browser and collect up to `limit` product page URLs."""
+    etf_urls = []
+    print("🚀 Opening browser context for Vanguard URLs...")
+    # Cookies from an earlier run already hold the consent choice, so the banner normally does not
+    # appear and the consent check only needs a short timeout.
+    has_consent_state = os.path.exists(CONSENT_STATE_FILE)
+    context = await browser.new_context(storage_state=CONSENT_STATE_FILE if has_consent_state else None)
+    context.set_default_navigation_timeout(NAVIGATION_TIMEOUT_MS)
+    await context.route("**/*", block_heavy_resources)
+    page = await context.new_page()
+    try:
+        await page.goto(VANGUARD_URL, wait_until="domcontentloaded")
+        await handle_consent_flow(page, timeout=2000 if has_consent_state else 7000)
+        print(f"⏳ Waiting for Vanguard ETF list to load to collect the top {limit} URLs...")
+        await page.wait_for_selector(ROW_SELECTOR, timeout=60000)
+        show_more_button = page.locator(SHOW_MORE_SELECTOR)
+        row_count = await page.locator(ROW_SELECTOR).count()
+        # Only expand the table until it holds the rows we actually need.
+        while row_count < limit and await show_more_button.is_visible():
+            # The banner may have appeared after the table won the consent race; its overlay would block the click.
+            if await page.locator(COOKIE_BUTTON).is_visible():
+                await accept_cookie_banner(page, 5000)
+            await show_more_button.click()
+            try:
+                await page.wait_for_function(ROWS_GREW_JS, arg=[ROW_SELECTOR, row_count], timeout=15000)
+            except PlaywrightTimeoutError:
+                break  # No new rows arrived; keep the ones already loaded.
+            row_count = await page.locator(ROW_SELECTOR).count()
+        hrefs = await page.eval_on_selector_all(LINK_SELECTOR, FIRST_N_HREFS_JS, limit)
+        etf_urls = [urljoin(VANGUARD_URL, href) for href in hrefs if href]
+        await save_consent_state(context)
+    finally:
+        await context.close()
+    print(f"✅ Collected {len(etf_urls)} Vanguard ETF URLs.")
+    return etf_urls